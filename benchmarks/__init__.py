@@ -0,0 +1,11 @@
+# !/usr/bin/env python
+#  -*- coding: utf-8 -*-
+"""
+Benchmarks of the converters, the plotting utilities and the lif simulation.
+
+Fixtures are generated offline from a fixed seed, every stage is timed several times and the
+results (latency, throughput, peak memory) are written as JSON, so that runs can be compared:
+
+    python -m benchmarks.run --scale small --out results.json
+    python -m benchmarks.run --scale small --out new.json --compare results.json
+"""
@@ -0,0 +1,186 @@
+# !/usr/bin/env python
+#  -*- coding: utf-8 -*-
+"""
+Synthetic, seeded input files for the benchmarks, laid out like the original data sets:
+
+    pvc6.h5                                     Sweep_N datasets (samples x [stimulus, voltage])
+    crcns_ret-1/Data/20080516_R1.mat            spikes, datainfo and stimulus structs
+    crcns_ret-1/ran1.bin                        binary white noise stimulus
+    pvc-7/122008_140124_windowmix/...           imaging, eye/mouse movies, run speed, stimulus
+    mea.csv                                     numeric CSV (Leibig MEA export)
+    traces.nix                                  large NIX file (see gen-demo-data.py)
+
+The files are only generated if the fixture directory does not hold fixtures of the same scale
+and seed yet.
+"""
+from __future__ import print_function, division
+
+import json
+import os
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALES = {
+    'small': {'sweeps': 4, 'sweep_samples': 200000, 'cells': 20, 'recordings': 2, 'spikes': 2000,
+              'stim_frames': 3000, 'stim_side': 10, 'pvc7_frames': 200, 'movie_size': (120, 160),
+              'csv_rows': 20000, 'csv_cols': 32, 'nix_size': 2**25, 'lif_steps': 20000},
+    'medium': {'sweeps': 16, 'sweep_samples': 1000000, 'cells': 50, 'recordings': 4, 'spikes': 10000,
+               'stim_frames': 20000, 'stim_side': 20, 'pvc7_frames': 1000, 'movie_size': (240, 320),
+               'csv_rows': 200000, 'csv_cols': 64, 'nix_size': 2**28, 'lif_steps': 200000},
+    'large': {'sweeps': 64, 'sweep_samples': 4000000, 'cells': 100, 'recordings': 4, 'spikes': 50000,
+              'stim_frames': 100000, 'stim_side': 40, 'pvc7_frames': 5000, 'movie_size': (480, 640),
+              'csv_rows': 2000000, 'csv_cols': 64, 'nix_size': 2**31, 'lif_steps': 2000000},
+}
+
+
+def load_script(filename):
+    """
+    Imports a script of the repository whose name is not a valid module name (gen-demo-data.py).
+    """
+    path = os.path.join(ROOT, filename)
+    name = os.path.splitext(os.path.basename(filename))[0].replace('-', '_')
+    try:
+        from importlib.util import spec_from_file_location, module_from_spec
+    except ImportError:
+        import imp
+        return imp.load_source(name, path)
+    spec = spec_from_file_location(name, path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_pvc6(path, rng, sweeps, samples):
+    import h5py
+
+    with h5py.File(path, 'w') as f:
+        for n in range(sweeps):
+            # current steps of random length and amplitude, the same protocol for pairs of sweeps
+            steps = np.random.RandomState([n // 2]).randint(samples // 50, samples // 5, 64)
+            edges = np.concatenate(([0], np.cumsum(steps)))
+            edges = edges[edges < samples]
+            levels = np.random.RandomState([n // 2, 1]).choice([-100.0, 0.0, 50.0, 100.0, 200.0], len(edges))
+            stim = np.repeat(levels, np.diff(np.append(edges, samples)))
+            volt = -65.0 + 0.05 * stim + rng.randn(samples)
+            f.create_dataset('Sweep_%d' % n, data=np.column_stack((stim, volt)))
+
+
+def make_ret1(path, rng, cells, recordings, spikes, frames, side):
+    import scipy.io
+
+    data_dir = os.path.join(path, 'Data')
+    if not os.path.isdir(data_dir):
+        os.makedirs(data_dir)
+
+    interval = 1.0 / 60
+    trains = np.empty((cells, recordings), dtype=object)
+    for c in range(cells):
+        for r in range(recordings):
+            trains[c, r] = np.sort(rng.uniform(0, frames * interval, spikes))
+
+    datainfo = {'RecNo': np.arange(1, recordings + 1, dtype=float),
+                'RecStartTime': np.tile([2008, 5, 16, 12, 0, 0], (recordings, 1)).astype(float),
+                'Species': 'mouse', 'Preparation': 'retina'}
+    stimulus = np.empty(recordings, dtype=object)
+    for r in range(recordings):
+        stimulus[r] = {'Nframes': float(frames + 1), 'type': 'binary white noise', 'refresh': 1.0,
+                       'param': {'x': float(side), 'dx': 1.0, 'y': float(side), 'dy': 1.0, 'seed': -10000.0}}
+
+    scipy.io.savemat(os.path.join(data_dir, '20080516_R1.mat'),
+                     {'spikes': trains, 'datainfo': datainfo, 'stimulus': stimulus})
+
+    n_bits = frames * side * side
+    with open(os.path.join(path, 'ran1.bin'), 'wb') as fd:
+        fd.write(rng.randint(0, 256, (n_bits + 7) // 8).astype(np.uint8).tobytes())
+
+
+def make_pvc7(path, rng, frames, movie_size):
+    import cv2
+    import h5py
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    height, width = movie_size
+    with h5py.File(os.path.join(path, 'concat_31Hz.h5'), 'w') as f:
+        f.create_dataset('data', data=rng.randint(0, 4096, (frames, height, width)).astype(np.uint16))
+
+    for name in ('eye', 'mouse'):
+        writer = cv2.VideoWriter(os.path.join(path, name + '.avi'), cv2.VideoWriter_fourcc(*'MJPG'), 30.0,
+                                 (width, height))
+        for i in range(frames):
+            frame = rng.randint(0, 64, (height, width, 3)).astype(np.uint8)
+            cv2.circle(frame, (int(width / 2 + width / 4 * np.cos(i / 20.0)), height // 2), 10, (255, 255, 255), -1)
+            writer.write(frame)
+        writer.release()
+        with open(os.path.join(path, name + '_times.txt'), 'w') as fd:
+            fd.writelines('%d.%03d\n' % (i, rng.randint(1000)) for i in range(frames))
+
+    with open(os.path.join(path, 'runspeed.txt'), 'w') as fd:
+        fd.writelines('%.4f\n' % v for v in np.abs(rng.randn(frames)) * 10)
+
+    with open(os.path.join(path, 'stimulus.csv'), 'w') as fd:
+        fd.write('start,duration,orientation,SF,TF,contrast\n')
+        for start in range(0, frames, 10):
+            fd.write('%d,%d,%d,%.2f,%d,%.2f\n' % (start, 8, rng.choice([0, 45, 90, 135]), rng.choice([0.02, 0.04]),
+                                                 rng.choice([1, 2, 4]), rng.choice([0.1, 0.8])))
+
+
+def make_csv(path, rng, rows, cols, block=65536):
+    with open(path, 'w') as fd:
+        for a in range(0, rows, block):
+            np.savetxt(fd, rng.randn(min(block, rows - a), cols), delimiter=',', fmt='%.6f')
+
+
+def make_traces(path, seed, size):
+    import nixio as nix
+
+    gen = load_script('gen-demo-data.py')
+    nf = nix.File.open(path, nix.FileMode.Overwrite)
+    try:
+        gen.create_large_data(nf, size, seed=seed, depth=3, cells=20)
+    finally:
+        nf.close()
+
+
+def make_fixtures(directory, scale='small', seed=42, force=False):
+    """
+    Generates all fixtures of a scale in <directory> (unless they exist already).
+
+    :return:    Dict fixture name -> path plus the scale parameters ('params')
+    """
+    params = SCALES[scale]
+    stamp = os.path.join(directory, 'fixtures.json')
+    fixtures = {
+        'pvc6': os.path.join(directory, 'pvc6.h5'),
+        'ret1': os.path.join(directory, 'crcns_ret-1'),
+        'ret1_mat': os.path.join(directory, 'crcns_ret-1', 'Data', '20080516_R1.mat'),
+        'pvc7': os.path.join(directory, 'pvc-7'),
+        'csv': os.path.join(directory, 'mea.csv'),
+        'traces': os.path.join(directory, 'traces.nix'),
+        'root': directory,
+        'params': params,
+    }
+
+    key = {'scale': scale, 'seed': seed, 'params': params}
+    if not force and os.path.exists(stamp):
+        with open(stamp, 'r') as fd:
+            if json.load(fd) == json.loads(json.dumps(key)):
+                return fixtures
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    make_pvc6(fixtures['pvc6'], np.random.RandomState([seed, 1]), params['sweeps'], params['sweep_samples'])
+    make_ret1(fixtures['ret1'], np.random.RandomState([seed, 2]), params['cells'], params['recordings'],
+              params['spikes'], params['stim_frames'], params['stim_side'])
+    make_pvc7(os.path.join(fixtures['pvc7'], '122008_140124_windowmix'), np.random.RandomState([seed, 3]),
+              params['pvc7_frames'], params['movie_size'])
+    make_csv(fixtures['csv'], np.random.RandomState([seed, 4]), params['csv_rows'], params['csv_cols'])
+    make_traces(fixtures['traces'], seed, params['nix_size'])
+
+    with open(stamp, 'w') as fd:
+        json.dump(key, fd)
+    return fixtures
@@ -0,0 +1,186 @@
+# !/usr/bin/env python
+#  -*- coding: utf-8 -*-
+"""
+Timing, memory measurement and result files of the benchmarks.
+"""
+from __future__ import print_function, division
+
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+clock = getattr(time, 'perf_counter', time.time)
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """
+    Registers a benchmark. The decorated function is called with the fixtures dict and a
+    scratch directory and returns a dict with the callable to time ('run') and optionally the
+    bytes ('nbytes') or items ('items') it processes and a 'cleanup' callable.
+    """
+    def register(fn):
+        BENCHMARKS.append((name, fn))
+        return fn
+    return register
+
+
+def max_rss():
+    """
+    Returns the peak resident set size of this process in bytes (or None).
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def measure(run, repeat=3, nbytes=None, items=None, memory=True):
+    """
+    Times <run> <repeat> times. Peak memory is measured in one extra run with tracemalloc, so that
+    its overhead does not end up in the timings.
+
+    :return:    Result dict with the latencies in seconds, throughput and peak memory in bytes
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = clock()
+        run()
+        times.append(clock() - start)
+
+    peak = None
+    if memory and tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    ordered = sorted(times)
+    best = ordered[0]
+    result = {
+        'repeat': repeat,
+        'seconds': {'min': best, 'median': ordered[len(ordered) // 2], 'max': ordered[-1], 'all': times},
+        'peak_memory': peak,
+        'max_rss': max_rss(),
+    }
+    if nbytes is not None:
+        result['bytes'] = nbytes
+        result['bytes_per_second'] = nbytes / best if best > 0 else None
+    if items is not None:
+        result['items'] = items
+        result['items_per_second'] = items / best if best > 0 else None
+    return result
+
+
+def run_benchmark(name, fn, fixtures, workdir, repeat=3, memory=True):
+    """
+    Sets up and measures one registered benchmark. Failures are recorded in the result instead
+    of stopping the suite.
+    """
+    case = None
+    try:
+        case = fn(fixtures, workdir)
+        result = measure(case['run'], repeat, case.get('nbytes'), case.get('items'), memory)
+    except Exception as e:
+        result = {'error': '%s: %s' % (type(e).__name__, e), 'traceback': traceback.format_exc()}
+    finally:
+        if case is not None and case.get('cleanup') is not None:
+            case['cleanup']()
+    result['name'] = name
+    return result
+
+
+def environment():
+    """
+    Describes the interpreter, the library versions and the checked out commit.
+    """
+    env = {'python': platform.python_version(), 'platform': platform.platform(), 'time': time.time()}
+    for module in ('numpy', 'scipy', 'h5py', 'nixio', 'matplotlib', 'cv2'):
+        try:
+            env[module] = __import__(module).__version__
+        except Exception:
+            env[module] = None
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env['commit'] = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=root).decode().strip()
+    except Exception:
+        env['commit'] = None
+    return env
+
+
+def save_results(results, path, params=None):
+    with open(path, 'w') as fd:
+        json.dump({'environment': environment(), 'params': params or {}, 'results': results}, fd, indent=2)
+
+
+def load_results(path):
+    with open(path, 'r') as fd:
+        return json.load(fd)
+
+
+def compare(baseline, current, tolerance=0.1):
+    """
+    Compares the best latencies of two result files (dicts as loaded by load_results).
+
+    :param tolerance:   Relative slowdown that still counts as unchanged
+    :return:            List of (name, baseline seconds, current seconds, ratio, regressed)
+    """
+    old = dict((r['name'], r) for r in baseline['results'] if 'seconds' in r)
+    rows = []
+    for r in current['results']:
+        if 'seconds' not in r or r['name'] not in old:
+            continue
+        a = old[r['name']]['seconds']['min']
+        b = r['seconds']['min']
+        ratio = b / a if a > 0 else float('inf')
+        rows.append((r['name'], a, b, ratio, ratio > 1.0 + tolerance))
+    return rows
+
+
+def format_size(n):
+    if n is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n) < 1024 or unit == 'GB':
+            return '%.1f%s' % (n, unit)
+        n /= 1024.0
+
+
+def summary(results):
+    """
+    Returns a text table of the results.
+    """
+    lines = ['%-28s %10s %10s %14s %10s' % ('benchmark', 'min [s]', 'median [s]', 'throughput', 'peak mem')]
+    for r in results:
+        if 'error' in r:
+            lines.append('%-28s %s' % (r['name'], r['error']))
+            continue
+        if r.get('bytes_per_second'):
+            throughput = format_size(r['bytes_per_second']) + '/s'
+        elif r.get('items_per_second'):
+            throughput = '%.0f/s' % r['items_per_second']
+        else:
+            throughput = '-'
+        lines.append('%-28s %10.4f %10.4f %14s %10s' % (r['name'], r['seconds']['min'], r['seconds']['median'],
+                                                        throughput, format_size(r['peak_memory'])))
+    return '\n'.join(lines)
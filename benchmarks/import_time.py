@@ -0,0 +1,114 @@
+# !/usr/bin/env python
+#  -*- coding: utf-8 -*-
+"""
+Import-time regression check for the utils package and the command line tools.
+
+Every target is started in a fresh interpreter with `python -X importtime` (python >= 3.7). The
+check fails if a target pulls in one of the heavy modules that are only needed once a function
+actually uses them, or (with --compare) if its import time grew beyond the tolerance.
+
+    python -m benchmarks.import_time --out imports.json
+    python -m benchmarks.import_time --compare imports.json
+"""
+from __future__ import print_function, division
+
+import argparse
+import os
+import subprocess
+import sys
+
+from benchmarks.harness import compare, load_results, save_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that must not be loaded by importing a target
+HEAVY = ('cv2', 'matplotlib', 'scipy.signal', 'PIL')
+
+MODULES = ('utils', 'utils.plotting', 'utils.video_player', 'utils.notebook', 'utils.epochs', 'utils.sta',
+           'utils.columnar', 'utils.inventory', 'utils.memmap', 'utils.lif', 'utils.rates')
+
+# command line tools, checked with --help
+CLIS = ('nix-plot', 'gen-demo-data.py', 'scripts/convert_pvc6.py', 'scripts/convert_ret1.py',
+        'scripts/pvc7_2nix.py', 'scripts/rechunk_video.py', 'utils/video_player.py')
+
+
+def import_times(argv):
+    """
+    Runs <argv> with -X importtime and returns a dict module -> self time in seconds.
+    """
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime'] + argv, cwd=ROOT, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError('%s failed: %s' % (' '.join(argv), err.decode(errors='replace')[-500:]))
+
+    times = {}
+    for line in err.decode(errors='replace').splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(self_us) / 1e6
+    return times
+
+
+def heavy_modules(modules):
+    """
+    Returns the entries of HEAVY that were (partly) imported.
+    """
+    return sorted(h for h in HEAVY if any(m == h or m.startswith(h + '.') for m in modules))
+
+
+def check(name, argv, repeat=3):
+    """
+    Imports a target <repeat> times and returns its result dict (best total time, heavy modules).
+    """
+    totals, modules = [], {}
+    for _ in range(repeat):
+        modules = import_times(argv)
+        totals.append(sum(modules.values()))
+    heavy = heavy_modules(modules)
+    return {'name': name, 'seconds': {'min': min(totals), 'all': totals}, 'modules': len(modules), 'heavy': heavy}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time regression check')
+    parser.add_argument('--repeat', default=3, type=int)
+    parser.add_argument('--out', default=None, help='JSON file for the results')
+    parser.add_argument('--compare', default=None, help='Earlier result file to compare with')
+    parser.add_argument('--tolerance', default=0.5, type=float, help='Relative slowdown reported as regression')
+    args = parser.parse_args()
+
+    if sys.version_info < (3, 7):
+        parser.error('-X importtime needs python 3.7 or newer')
+
+    targets = [('import ' + m, ['-c', 'import ' + m]) for m in MODULES]
+    targets += [(cli + ' --help', [cli, '--help']) for cli in CLIS]
+
+    results, failed = [], False
+    for name, argv in targets:
+        try:
+            result = check(name, argv, args.repeat)
+        except RuntimeError as e:
+            result = {'name': name, 'error': str(e)}
+            print('%-40s ERROR %s' % (name, e))
+            failed = True
+        else:
+            print('%-40s %8.1f ms %5d modules %s' % (name, result['seconds']['min'] * 1000, result['modules'],
+                                                     'HEAVY: ' + ', '.join(result['heavy']) if result['heavy'] else ''))
+            failed = failed or bool(result['heavy'])
+        results.append(result)
+
+    if args.out:
+        save_results(results, args.out, {'repeat': args.repeat})
+
+    if args.compare:
+        for name, a, b, ratio, slower in compare(load_results(args.compare), {'results': results}, args.tolerance):
+            if slower:
+                print('%-40s %8.1f -> %8.1f ms  x%.2f REGRESSION' % (name, a * 1000, b * 1000, ratio))
+                failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
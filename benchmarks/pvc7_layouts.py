@@ -0,0 +1,290 @@
+# !/usr/bin/env python
+#  -*- coding: utf-8 -*-
+"""
+Read path benchmark of the two pvc-7 layouts: data arrays and tags (nix, pvc7_2nix.py) versus
+matrix, point and region lists (nix2, pvc7_2nix2.py / pvc7_nix2nix2.py).
+
+Both files are built from the pvc-7 fixture and rewritten with several chunk and compression
+settings. Every query of the pvc-7 notebooks (stimulus combination lookup, frame at stimulus
+onset for the mouse, eye and imaging data, the full runspeed trace) is timed on an open file
+(warm) and once right after opening it (cold), together with the bytes the cold run read from
+disk (linux only). The nix2 layout is skipped if nix2 is not installed.
+
+    python -m benchmarks.pvc7_layouts --scale small --out layouts.json
+    python -m benchmarks.pvc7_layouts --settings contiguous,frames-gzip --compare layouts.json
+"""
+from __future__ import print_function, division
+
+import argparse
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+
+import h5py
+import nixio as nix
+import numpy as np
+
+from benchmarks.fixtures import ROOT, make_fixtures
+from benchmarks.harness import clock, compare, format_size, load_results, measure, save_results
+
+for path in (ROOT, os.path.join(ROOT, 'scripts')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+try:
+    import nix2
+except ImportError:
+    nix2 = None
+
+# dataset creation parameters; None keeps the file as written by the converter. 'frames'
+# chunks hold one frame (the leading axes are 1 as long as the rest has FRAME_ELEMENTS).
+SETTINGS = {
+    'default': None,
+    'contiguous': {'chunks': None},
+    'auto': {'chunks': True},
+    'auto-gzip': {'chunks': True, 'compression': 'gzip', 'compression_opts': 4},
+    'frames': {'chunks': 'frames'},
+    'frames-gzip': {'chunks': 'frames', 'compression': 'gzip', 'compression_opts': 4},
+}
+
+FRAME_ELEMENTS = 4096
+
+# datasets with fewer elements (attributes, names, single values) are not rewritten
+MIN_ELEMENTS = 64
+
+QUERIES = ('stimulus', 'frame mouse', 'frame eye', 'frame imaging', 'runspeed')
+
+
+def read_bytes():
+    """
+    Returns the number of bytes this process read via read system calls so far (or None).
+    """
+    try:
+        with open('/proc/self/io', 'r') as fd:
+            for line in fd:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def frame_chunks(shape):
+    chunks = list(shape)
+    for i in range(len(shape) - 1):
+        if int(np.prod(shape[i + 1:])) < FRAME_ELEMENTS:
+            break
+        chunks[i] = 1
+    return tuple(chunks)
+
+
+def rewrite(path, setting, block_bytes=2**26):
+    """
+    Rewrites all numeric datasets of an HDF5 file in place with the dataset creation parameters
+    of <setting>.
+
+    :return:    Bytes the rewritten datasets occupy in the file
+    """
+    options = SETTINGS[setting]
+    with h5py.File(path, 'a') as f:
+        names = []
+        f.visititems(lambda name, obj: names.append(name) if isinstance(obj, h5py.Dataset) else None)
+
+        storage = 0
+        for name in names:
+            source = f[name]
+            if source.dtype.kind not in 'biuf' or source.size < MIN_ELEMENTS or options is None:
+                storage += source.id.get_storage_size()
+                continue
+
+            kwargs = dict(options)
+            if kwargs['chunks'] == 'frames':
+                kwargs['chunks'] = frame_chunks(source.shape)
+            target = f.create_dataset(name + '.rewritten', shape=source.shape, dtype=source.dtype,
+                                       **kwargs)
+            for key, value in source.attrs.items():
+                target.attrs[key] = value
+
+            row_bytes = max(1, source.dtype.itemsize * int(np.prod(source.shape[1:])))
+            rows = max(1, block_bytes // row_bytes)
+            for start in range(0, source.shape[0], rows):
+                target[start:start + rows] = source[start:start + rows]
+
+            del f[name]
+            f.move(name + '.rewritten', name)
+            storage += f[name].id.get_storage_size()
+    return storage
+
+
+def make_nix(fixtures, path, resize=2):
+    """
+    Converts the pvc-7 fixture with pvc7_2nix.py.
+    """
+    script = os.path.join(ROOT, 'scripts', 'pvc7_2nix.py')
+    argv = sys.argv
+    sys.argv = [script, '-p', fixtures['pvc7'], '-o', path, '-s', '0', '-e', str(fixtures['params']['pvc7_frames']),
+                '-c', str(resize), '-q', '--no-memory']
+    try:
+        runpy.run_path(script, run_name='__main__')
+    finally:
+        sys.argv = argv
+
+
+def make_nix2(nix_file, path):
+    """
+    Translates a pvc-7 nix file into the nix2 layout.
+    """
+    from pvc7_nix2nix2 import translate
+    translate(nix_file, path, quiet=True, memory=False)
+
+
+def frame_index(ticks, time):
+    """Index of the first frame after <time>"""
+    return min(int(np.searchsorted(ticks, time, side='right')), len(ticks) - 1)
+
+
+def query_nix(f, query, index):
+    block = f.blocks[0]
+    recording = block.tags['recording']
+    if query == 'stimulus':
+        stimulus = recording.features[0].data
+        return stimulus[index], recording.position[index], recording.extent[index]
+    if query == 'runspeed':
+        return block.data_arrays['runspeed'][:]
+
+    name = {'frame mouse': 'mouse.avi', 'frame eye': 'eye.avi', 'frame imaging': 'concat'}[query]
+    time = recording.position[index]
+    if query == 'frame eye':
+        time += recording.extent[index]
+    array = block.data_arrays[name]
+    return array[frame_index(np.asarray(array.dimensions[0].ticks), time)]
+
+
+def query_nix2(f, query, index):
+    block = f.blocks[0]
+    recording = block.region_lists[0]
+    if query == 'stimulus':
+        stimulus = recording.feature_points[0]
+        return stimulus.all_data[index], recording.all_data[index]
+
+    matrices = dict((ml.name, ml) for ml in block.matrix_lists)
+    if query == 'runspeed':
+        return matrices['runspeed'][0][:]
+
+    name = {'frame mouse': 'mouse.avi', 'frame eye': 'eye.avi', 'frame imaging': 'concat'}[query]
+    start, extent = recording.all_data[index]
+    time = start[0] + extent[0] if query == 'frame eye' else start[0]
+    matrix = matrices[name][0]
+    return matrix[frame_index(np.asarray(matrix.dims[0].scale), time)]
+
+
+LAYOUTS = {
+    'nix': (lambda path: nix.File.open(path, nix.FileMode.ReadOnly), query_nix),
+    'nix2': (lambda path: nix2.File(path, nix2.FileMode.ReadOnly), query_nix2),
+}
+
+
+def run_query(path, layout, query, index, repeat=3):
+    """
+    Times one query: cold (first run after opening the file, with the bytes read) and warm.
+    """
+    open_file, run = LAYOUTS[layout]
+
+    f = open_file(path)
+    before = read_bytes()
+    start = clock()
+    run(f, query, index)
+    cold = clock() - start
+    after = read_bytes()
+    f.close()
+
+    f = open_file(path)
+    try:
+        result = measure(lambda: run(f, query, index), repeat, memory=False)
+    finally:
+        f.close()
+    result['cold_seconds'] = cold
+    result['bytes_read'] = after - before if before is not None else None
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Read path benchmark of the pvc-7 nix and nix2 layouts')
+    parser.add_argument('--scale', default='small', help='Fixture scale: small, medium or large')
+    parser.add_argument('--seed', default=42, type=int)
+    parser.add_argument('--fixtures', default=None, help='Fixture directory (default: a cache in the temp dir)')
+    parser.add_argument('--settings', default=','.join(sorted(SETTINGS)),
+                        help='Comma separated chunk/compression settings: %s' % ', '.join(sorted(SETTINGS)))
+    parser.add_argument('--layouts', default='nix,nix2', help='Comma separated layouts: nix, nix2')
+    parser.add_argument('--index', default=None, type=int, help='Stimulus combination to query (default: middle)')
+    parser.add_argument('--repeat', default=5, type=int)
+    parser.add_argument('--out', default=None, help='JSON file for the results')
+    parser.add_argument('--compare', default=None, help='Earlier result file to compare with')
+    parser.add_argument('--tolerance', default=0.1, type=float, help='Relative slowdown reported as regression')
+    args = parser.parse_args()
+
+    layouts = args.layouts.split(',')
+    if 'nix2' in layouts and nix2 is None:
+        print('nix2 is not installed, skipping the nix2 layout')
+        layouts.remove('nix2')
+    settings = args.settings.split(',')
+    for setting in settings:
+        if setting not in SETTINGS:
+            parser.error('unknown setting %s' % setting)
+
+    directory = args.fixtures or os.path.join(tempfile.gettempdir(), 'nix-demo-benchmarks-%s-%d' % (args.scale,
+                                                                                                  args.seed))
+    print('fixtures in %s' % directory)
+    fixtures = make_fixtures(directory, args.scale, args.seed)
+
+    workdir = tempfile.mkdtemp(prefix='nix-demo-layouts-')
+    results = []
+    try:
+        sources = {'nix': os.path.join(workdir, 'pvc-7.nix.h5')}
+        make_nix(fixtures, sources['nix'])
+        if 'nix2' in layouts:
+            sources['nix2'] = os.path.join(workdir, 'pvc-7.nix2.h5')
+            make_nix2(sources['nix'], sources['nix2'])
+
+        f = nix.File.open(sources['nix'], nix.FileMode.ReadOnly)
+        count = len(f.blocks[0].tags['recording'].position)
+        f.close()
+        index = count // 2 if args.index is None else args.index
+
+        print('%-32s %-14s %10s %10s %12s %10s' % ('layout/setting', 'query', 'cold [ms]', 'warm [ms]', 'bytes read',
+                                                   'storage'))
+        for layout in layouts:
+            for setting in settings:
+                path = os.path.join(workdir, '%s-%s.h5' % (layout, setting))
+                shutil.copyfile(sources[layout], path)
+                storage = rewrite(path, setting)
+                for query in QUERIES:
+                    result = run_query(path, layout, query, index, args.repeat)
+                    result.update(name='%s/%s/%s' % (layout, setting, query), layout=layout, setting=setting,
+                                  query=query, storage=storage)
+                    results.append(result)
+                    print('%-32s %-14s %10.3f %10.3f %12s %10s' % (
+                        '%s/%s' % (layout, setting), query, result['cold_seconds'] * 1000,
+                        result['seconds']['min'] * 1000, format_size(result['bytes_read']), format_size(storage)))
+                os.remove(path)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.out:
+        save_results(results, args.out, {'scale': args.scale, 'seed': args.seed, 'repeat': args.repeat,
+                                         'index': index})
+
+    if args.compare:
+        regressed = False
+        for name, a, b, ratio, slower in compare(load_results(args.compare), {'results': results}, args.tolerance):
+            print('%-48s %8.3f -> %8.3f ms  x%.2f%s' % (name, a * 1000, b * 1000, ratio,
+                                                        '  REGRESSION' if slower else ''))
+            regressed = regressed or slower
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
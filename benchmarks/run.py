@@ -0,0 +1,327 @@
+# !/usr/bin/env python
+#  -*- coding: utf-8 -*-
+"""
+The benchmark suite. Run from the repository root:
+
+    python -m benchmarks.run --scale small --out results.json [--only 'convert.*'] [--compare old.json]
+"""
+from __future__ import print_function, division
+
+import argparse
+import fnmatch
+import io
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from benchmarks.fixtures import ROOT, load_script, make_fixtures
+from benchmarks.harness import BENCHMARKS, benchmark, compare, load_results, run_benchmark, save_results, summary
+
+# the converters import their siblings (instrument, pvc7_parser) by module name
+for path in (ROOT, os.path.join(ROOT, 'scripts')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def file_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+# converters
+
+@benchmark('convert.pvc6')
+def bench_convert_pvc6(fixtures, workdir):
+    from scripts import convert_pvc6
+
+    out = os.path.join(workdir, 'pvc6.nix')
+    sweeps = fixtures['params']['sweeps']
+    return {'run': lambda: convert_pvc6.convert(fixtures['pvc6'], out, 0, sweeps, quiet=True, memory=False,
+                                                   overwrite=True),
+            'nbytes': file_size(fixtures['pvc6']), 'cleanup': lambda: remove(out)}
+
+
+@benchmark('convert.ret1')
+def bench_convert_ret1(fixtures, workdir):
+    from scripts import convert_ret1
+
+    # the converter reads crcns_ret-1/ran1.bin relative to the working directory and writes the
+    # nix file next to the .mat file
+    mat = fixtures['ret1_mat']
+    out = mat[:-3] + 'nix'
+
+    def run():
+        cwd = os.getcwd()
+        os.chdir(fixtures['root'])
+        try:
+            convert_ret1.export_retina_data(os.path.relpath(mat, fixtures['root']), export_stim=True, quiet=True,
+                                            memory=False)
+        finally:
+            os.chdir(cwd)
+
+    return {'run': run, 'nbytes': file_size(fixtures['ret1']), 'cleanup': lambda: remove(out)}
+
+
+@benchmark('convert.pvc7')
+def bench_convert_pvc7(fixtures, workdir):
+    out = os.path.join(workdir, 'pvc-7.nix.h5')
+    script = os.path.join(ROOT, 'scripts', 'pvc7_2nix.py')
+
+    def run():
+        argv = sys.argv
+        sys.argv = [script, '-p', fixtures['pvc7'], '-o', out, '-s', '0', '-e', str(fixtures['params']['pvc7_frames']),
+                    '-c', '2', '-q', '--no-memory']
+        try:
+            runpy.run_path(script, run_name='__main__')
+        finally:
+            sys.argv = argv
+
+    return {'run': run, 'nbytes': file_size(fixtures['pvc7']), 'cleanup': lambda: remove(out)}
+
+
+@benchmark('ingest.csv')
+def bench_ingest_csv(fixtures, workdir):
+    gen = load_script('gen-demo-data.py')
+    return {'run': lambda: gen.load_csv(fixtures['csv'], cache=False), 'nbytes': file_size(fixtures['csv'])}
+
+
+# nix reads and plotting
+
+@benchmark('nix.read_trace')
+def bench_read_trace(fixtures, workdir):
+    import nixio as nix
+
+    nf = nix.File.open(fixtures['traces'], nix.FileMode.ReadOnly)
+    array = nf.blocks['synthetic'].data_arrays['trace 000']
+    return {'run': lambda: array[:], 'nbytes': array.shape[0] * 8, 'cleanup': nf.close}
+
+
+def window_case(fixtures, workdir, contiguous):
+    import nixio as nix
+    from utils.memmap import data_view, make_contiguous
+
+    nf = nix.File.open(fixtures['traces'], nix.FileMode.ReadOnly)
+    source = nf.blocks['synthetic'].data_arrays['trace 000']
+    path = os.path.join(workdir, 'windows.nix')
+    copy = nix.File.open(path, nix.FileMode.Overwrite)
+    array = copy.create_block('b', 'b').create_data_array('trace', source.type, data=source[:])
+    nf.close()
+    if contiguous:
+        make_contiguous(array)
+    copy.close()
+
+    copy = nix.File.open(path, nix.FileMode.ReadOnly)
+    data = data_view(copy.blocks['b'].data_arrays['trace'])
+    starts = np.random.RandomState(0).randint(0, data.shape[0] - 1000, 1000)
+
+    def run():
+        for a in starts:
+            np.asarray(data[a:a + 1000]).sum()
+
+    return {'run': run, 'items': len(starts), 'nbytes': len(starts) * 1000 * 8,
+            'cleanup': lambda: (copy.close(), remove(path))}
+
+
+@benchmark('nix.random_windows')
+def bench_random_windows(fixtures, workdir):
+    return window_case(fixtures, workdir, False)
+
+
+@benchmark('nix.random_windows_memmap')
+def bench_random_windows_memmap(fixtures, workdir):
+    return window_case(fixtures, workdir, True)
+
+
+def plot_case(fixtures, names):
+    import matplotlib
+    matplotlib.use('Agg')
+    import nixio as nix
+    from utils.plotting import Plotter
+
+    nf = nix.File.open(fixtures['traces'], nix.FileMode.ReadOnly)
+    arrays = [nf.blocks['synthetic'].data_arrays[n] for n in names]
+
+    def run():
+        import matplotlib.pyplot as plt
+        plotter = Plotter()
+        for array in arrays:
+            plotter.add(array)
+        plotter.plot()
+        plotter.last_figure.savefig(io.BytesIO(), format='png')
+        plt.close(plotter.last_figure)
+
+    nbytes = sum(int(np.prod(a.shape)) * np.dtype(a.dtype).itemsize for a in arrays)
+    return {'run': run, 'nbytes': nbytes, 'cleanup': nf.close}
+
+
+@benchmark('plot.trace')
+def bench_plot_trace(fixtures, workdir):
+    return plot_case(fixtures, ['trace 000'])
+
+
+@benchmark('plot.image')
+def bench_plot_image(fixtures, workdir):
+    return plot_case(fixtures, ['image 000'])
+
+
+@benchmark('plot.raster')
+def bench_plot_raster(fixtures, workdir):
+    return plot_case(fixtures, ['cell %04d spikes' % i for i in range(20)])
+
+
+@benchmark('video.export')
+def bench_video_export(fixtures, workdir):
+    import nixio as nix
+    from utils.video_player import export_video
+
+    # frames in the last dimension (the efish tracking_data layout) are moved to the front by the
+    # reader, the overlay needs C-contiguous frames to draw the orientations with cv2
+    frames = 100
+    path = os.path.join(workdir, 'video.nix')
+    nf = nix.File.open(path, nix.FileMode.Overwrite)
+    block = nf.create_block('b', 'b')
+    data = np.random.RandomState(0).randint(0, 255, (120, 160, 3, frames)).astype(np.uint8)
+    video = block.create_data_array('video', 'movie', data=data)
+    for _ in range(3):
+        video.append_set_dimension()
+    video.append_range_dimension(np.arange(frames) * 40.0)
+
+    time = np.arange(frames) * 0.04
+    track = np.column_stack((80 + 40 * np.cos(time), 60 + 30 * np.sin(time), np.zeros(frames), time))
+    positions = block.create_data_array('positions', 'nix.positions', data=track)
+    positions.append_set_dimension()
+    positions.append_set_dimension()
+    orientations = block.create_data_array('orientations', 'nix.orientations', data=np.degrees(time))
+    orientations.append_set_dimension()
+    tag = block.create_multi_tag('tracking', 'nix.tracking', positions)
+    tag.create_feature(orientations, nix.LinkType.Indexed)
+
+    out = os.path.join(workdir, 'video.avi')
+    if export_video(video, out, tracking_tag=tag, show_orientation=True, workers=2) != frames:
+        raise AssertionError('not all frames were exported')
+
+    return {'run': lambda: export_video(video, out, tracking_tag=tag, show_orientation=True, workers=2),
+            'items': frames, 'nbytes': data.nbytes,
+            'cleanup': lambda: (nf.close(), remove(path), remove(out))}
+
+
+# analysis
+
+@benchmark('nix.tag_epochs')
+def bench_tag_epochs(fixtures, workdir):
+    import nixio as nix
+    from utils.epochs import tag_epochs
+
+    nf = nix.File.open(fixtures['traces'], nix.FileMode.ReadOnly)
+    tag = nf.blocks['synthetic'].multi_tags['stimulus']
+    array = tag.references[0]
+    interval = array.dimensions[0].sampling_interval
+
+    # the first epochs start before the data (position < pre): they have to be padded at the
+    # front, so that every sample stays at its time on the common axis
+    pre = 2 * tag.positions[0]
+    epochs, time = tag_epochs(tag, array, pre=pre, duration=0.25)
+    for i in (0, len(epochs) - 1):
+        valid = np.flatnonzero(~np.isnan(epochs[i]))
+        index = np.round((tag.positions[i] + time[valid]) / interval).astype(int)
+        if not np.array_equal(epochs[i, valid], array[index.min():index.max() + 1]):
+            raise AssertionError('epoch %d is not aligned with the time axis' % i)
+
+    return {'run': lambda: tag_epochs(tag, array, pre=pre, duration=0.25), 'items': len(epochs), 'cleanup': nf.close}
+
+
+@benchmark('rates.kernel_psth')
+def bench_rates(fixtures, workdir):
+    import nixio as nix
+    from utils.rates import kernel_rate, tag_psth
+
+    nf = nix.File.open(fixtures['traces'], nix.FileMode.ReadOnly)
+    block = nf.blocks['synthetic']
+    trains = [da for da in block.data_arrays if da.type == 'nix.events.spike_times']
+    tag = block.multi_tags['stimulus']
+
+    def run():
+        kernel_rate(trains, 0.001, 0.01)
+        tag_psth(tag, trains, 0.005, pre=0.1, sigma=0.01)
+
+    return {'run': run, 'items': sum(da.shape[0] for da in trains), 'cleanup': nf.close}
+
+
+# simulation
+
+@benchmark('lif.run_const_stim')
+def bench_lif(fixtures, workdir):
+    from utils.lif import lif
+
+    steps = fixtures['params']['lif_steps']
+    model = lif()
+    return {'run': lambda: model.run_const_stim(steps, 1.0), 'items': steps}
+
+
+@benchmark('lif.run_exact')
+def bench_lif_exact(fixtures, workdir):
+    from utils.lif import lif
+
+    steps = fixtures['params']['lif_steps']
+    model = lif(D=0.0)
+    return {'run': lambda: model.run_exact(steps, 1.0, voltage=True), 'items': steps}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the converters, plotting and simulation')
+    parser.add_argument('--scale', default='small', help='Fixture scale: small, medium or large')
+    parser.add_argument('--seed', default=42, type=int)
+    parser.add_argument('--fixtures', default=None, help='Fixture directory (default: a cache in the temp dir)')
+    parser.add_argument('--out', default=None, help='JSON file for the results')
+    parser.add_argument('--only', default=None, help='Comma separated globs of the benchmarks to run')
+    parser.add_argument('--repeat', default=3, type=int)
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='Skip the tracemalloc run')
+    parser.add_argument('--compare', default=None, help='Earlier result file to compare with')
+    parser.add_argument('--tolerance', default=0.1, type=float, help='Relative slowdown reported as regression')
+    args = parser.parse_args()
+
+    directory = args.fixtures or os.path.join(tempfile.gettempdir(), 'nix-demo-benchmarks-%s-%d' % (args.scale,
+                                                                                                  args.seed))
+    print('fixtures in %s' % directory)
+    fixtures = make_fixtures(directory, args.scale, args.seed)
+
+    patterns = args.only.split(',') if args.only else None
+    workdir = tempfile.mkdtemp(prefix='nix-demo-bench-')
+    results = []
+    try:
+        for name, fn in BENCHMARKS:
+            if patterns and not any(fnmatch.fnmatchcase(name, p) for p in patterns):
+                continue
+            print('running %s' % name)
+            results.append(run_benchmark(name, fn, fixtures, workdir, args.repeat, args.memory))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(summary(results))
+    if args.out:
+        save_results(results, args.out, {'scale': args.scale, 'seed': args.seed, 'repeat': args.repeat})
+
+    if args.compare:
+        regressed = False
+        current = {'results': results}
+        for name, a, b, ratio, slower in compare(load_results(args.compare), current, args.tolerance):
+            print('%-28s %10.4f -> %10.4f  x%.2f%s' % (name, a, b, ratio, '  REGRESSION' if slower else ''))
+            regressed = regressed or slower
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
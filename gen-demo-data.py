@@ -2,20 +2,52 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function, division
 
-import matplotlib.mlab as mlab
 import numpy as np
 import nixio as nix
 import argparse
+import collections
+import os
+import time
+
+SIZE_UNITS = {'': 1, 'B': 1, 'K': 2**10, 'KB': 2**10, 'M': 2**20, 'MB': 2**20,
+              'G': 2**30, 'GB': 2**30, 'T': 2**40, 'TB': 2**40}
+
+# share of the requested size that goes into each kind of data
+SIZE_SHARES = (('traces', 0.4), ('video', 0.3), ('images', 0.2), ('events', 0.1))
+
+TRACE_INTERVAL = 0.0001
+VIDEO_FRAME = (240, 320, 3)
+VIDEO_INTERVAL = 40.0
+
+# approximate file size of the objects around the data: a metadata section with its properties,
+# and a cell (spike and amplitude arrays, multi tag and feature)
+SECTION_BYTES = 15000
+CELL_BYTES = 10000
+
+# largest share of the requested size the metadata tree may take, smaller targets get a shallower tree
+METADATA_SHARE = 0.05
+
+
+def bivariate_normal(X, Y, sigmax=1.0, sigmay=1.0, mux=0.0, muy=0.0, sigmaxy=0.0):
+    """
+    Bivariate gaussian distribution for equal shape X, Y (formerly matplotlib.mlab.bivariate_normal).
+    """
+    Xmu = X - mux
+    Ymu = Y - muy
+    rho = sigmaxy / (sigmax * sigmay)
+    z = Xmu**2 / sigmax**2 + Ymu**2 / sigmay**2 - 2 * rho * Xmu * Ymu / (sigmax * sigmay)
+    denom = 2 * np.pi * sigmax * sigmay * np.sqrt(1 - rho**2)
+    return np.exp(-z / (2 * (1 - rho**2))) / denom
 
 
 def create_sample_1d(block):
     delta = 0.1
     x = np.sin(np.arange(0, 10, delta))*10 - 60
     array = block.create_data_array("signal", "nix.data.sampled.V", nix.DataType.Double, (len(x), ))
-    array.data[:] = x
+    array[:] = x
     array.unit = 'mV'
     array.label = 'Volt'
-    dim = array.create_sampled_dimension(1, delta)
+    dim = array.append_sampled_dimension(delta)
     dim.label = 'time'
     dim.unit = 's'
     return array
@@ -23,10 +55,10 @@ def create_sample_1d(block):
 
 def create_set_1d(block):
     array = block.create_data_array("spikes", "nix.events.position.Spikes-1", nix.DataType.Double, (10, ))
-    array.data[:] = np.arange(0, 10)
+    array[:] = np.arange(0, 10)
     array.unit = 's'
     array.label = 'time'
-    array.create_set_dimension(1)
+    array.append_set_dimension()
     return array
 
 
@@ -36,18 +68,18 @@ def create_sample_2d(block):
     x = np.arange(-3.0, 3.0, delta)
     y = np.arange(-3.0, 3.0, delta)
     X, Y = np.meshgrid(x, y)
-    Z1 = mlab.bivariate_normal(X, Y, 1.0, 1.0, 0.0, 0.0)
-    Z2 = mlab.bivariate_normal(X, Y, 1.5, 0.5, 1, 1)
+    Z1 = bivariate_normal(X, Y, 1.0, 1.0, 0.0, 0.0)
+    Z2 = bivariate_normal(X, Y, 1.5, 0.5, 1, 1)
     z = Z2-Z1+0.4  # difference of Gaussians
 
     array = block.create_data_array("rf", "nix.data.sampled.DF/F", nix.DataType.Double, (len(x), len(y)))
-    array.data[:] = z
+    array[:] = z
 
-    d1 = array.create_sampled_dimension(1, delta)
+    d1 = array.append_sampled_dimension(delta)
     d1.unit = 's'
     d1.label = 'time'
     d1.offset = 0
-    d2 = array.create_sampled_dimension(2, delta)
+    d2 = array.append_sampled_dimension(delta)
     d2.unit = 'mm'
     d2.label = 'location'
     d2.offset = -3.0
@@ -62,10 +94,10 @@ def create_set_sample_2d(block):
     n_samples = 4
     array = block.create_data_array("firing rate", "nix.data.sampled.spike_rate", nix.DataType.Double, (n_samples, len(x)))
     for i in range(n_samples):
-        array.data[i, :] = (np.sin(x * (1+i)) + 1.0) * 5.0
-    dim = array.create_set_dimension(1)
+        array[i, :] = (np.sin(x * (1+i)) + 1.0) * 5.0
+    dim = array.append_set_dimension()
     dim.labels = ['frq: %d' % (i+1) for i in range(n_samples)]
-    dim = array.create_sampled_dimension(2, delta)
+    dim = array.append_sampled_dimension(delta)
     dim.unit = 's'
     dim.label = 'time'
     array.unit = 'Hz'
@@ -73,18 +105,110 @@ def create_set_sample_2d(block):
     return array
 
 
-def create_leibig_data(block, path):
-    import csv
-    fd = open(path, 'rb')
-    lreader = csv.reader(fd, delimiter=',')
-    ldata = np.array([[float(x) for x in r] for r in lreader])
-    array = block.create_data_array("MEA", "nix.data.sampled.sensordata", nix.DataType.Double, ldata.shape)
-    array.data[:] = ldata
-    d1 = array.create_sampled_dimension(1, 7.4)
+def count_lines(path, block=2**24):
+    """
+    Counts the lines of a text file without decoding it.
+    """
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as fd:
+        while True:
+            buf = fd.read(block)
+            if not buf:
+                break
+            lines += buf.count(b'\n')
+            last = buf[-1:]
+    return lines + (last != b'\n')
+
+
+def read_csv_chunks(path, delimiter=',', rows=65536):
+    """
+    Parses a numeric CSV file in chunks of <rows> lines.
+
+    :return:    Generator of 2-D float arrays
+    """
+    with open(path, 'r') as fd:
+        cols = None
+        while True:
+            lines = [l.strip() for l in fd.readlines(rows * 64) if l.strip()]
+            if not lines:
+                break
+            if cols is None:
+                cols = len(lines[0].split(delimiter))
+            data = np.fromstring(delimiter.join(lines), dtype=np.float64, sep=delimiter)
+            if data.size != len(lines) * cols:
+                raise ValueError('%s: rows with differing number of columns' % path)
+            yield data.reshape(len(lines), cols)
+
+
+def load_csv(path, delimiter=',', cache=True):
+    """
+    Reads a numeric CSV file. The parsed data is kept as <path>.npy next to the file and
+    memory-mapped on later calls as long as it is newer than the CSV file.
+
+    :return:    2-D array (memory-mapped if cached)
+    """
+    cache_file = path + '.npy'
+    if cache and os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(path):
+        return np.load(cache_file, mmap_mode='r')
+
+    chunks = read_csv_chunks(path, delimiter)
+    first = next(chunks, None)
+    if first is None:
+        raise ValueError('%s contains no data' % path)
+    # empty lines are skipped, so this is an upper bound
+    shape = (count_lines(path), first.shape[1])
+
+    if not cache:
+        data = np.empty(shape)
+        n = fill_rows(data, first, chunks)
+        return data[:n]
+
+    tmp = cache_file + '.tmp'
+    try:
+        data = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float64, shape=shape)
+        n = fill_rows(data, first, chunks)
+        data.flush()
+        if n < shape[0]:
+            np.save(cache_file, data[:n])
+            del data
+            os.remove(tmp)
+        else:
+            del data
+            getattr(os, 'replace', os.rename)(tmp, cache_file)
+    except BaseException:
+        # neither a partial tmp file nor a partial cache newer than the CSV file is left behind
+        for name in (tmp, cache_file):
+            if os.path.exists(name):
+                os.remove(name)
+        raise
+    return np.load(cache_file, mmap_mode='r')
+
+
+def fill_rows(data, first, chunks):
+    """
+    Copies the first chunk and the remaining <chunks> into consecutive rows of <data>.
+
+    :return:    Number of rows written
+    """
+    data[:len(first)] = first
+    n = len(first)
+    for chunk in chunks:
+        data[n:n + len(chunk)] = chunk
+        n += len(chunk)
+    return n
+
+
+def create_leibig_data(block, path, cache=True, rows=65536):
+    data = load_csv(path, cache=cache)
+    array = block.create_data_array("MEA", "nix.data.sampled.sensordata", nix.DataType.Double, data.shape)
+    for a in range(0, data.shape[0], rows):
+        array[a:a + rows] = data[a:a + rows]
+    d1 = array.append_sampled_dimension(7.4)
     d1.unit = 'um'
     d1.label = 'x'
     d1.offset = 0
-    d2 = array.create_sampled_dimension(2, 14.8)
+    d2 = array.append_sampled_dimension(14.8)
     d2.unit = 'um'
     d2.label = 'y'
     d2.offset = 0
@@ -92,11 +216,246 @@ def create_leibig_data(block, path):
     array.label = 'voltage'
     return array
 
+
+def parse_size(text):
+    """
+    Parses sizes like '500MB', '1.5G' or '200GB' into bytes.
+    """
+    text = text.strip().upper()
+    number = text.rstrip('KMGTB')
+    return int(float(number) * SIZE_UNITS[text[len(number):]])
+
+
+def chunk_data(job):
+    """
+    Creates one chunk of synthetic data. Every chunk has its own random stream derived from the
+    seed, the array and the chunk number, so for a given chunk size the result does not depend on the number of workers.
+
+    :param job: Tuple (kind, seed, stream, index, start, count, params)
+    :return:    The data of the chunk
+    """
+    kind, seed, stream, index, start, count, params = job
+    rng = np.random.RandomState([seed, stream, index])
+
+    if kind == 'trace':
+        t = (start + np.arange(count)) * TRACE_INTERVAL
+        return -60.0 + 10.0 * np.sin(2 * np.pi * params['frequency'] * t) + rng.randn(count)
+
+    if kind == 'image':
+        cols = params['cols']
+        x = (start + np.arange(count))[:, np.newaxis] / float(params['rows']) * 6.0 - 3.0
+        y = np.arange(cols)[np.newaxis, :] / float(cols) * 6.0 - 3.0
+        z = bivariate_normal(x, y, 1.5, 0.5, 1, 1) - bivariate_normal(x, y, 1.0, 1.0, 0.0, 0.0)
+        return (z + 0.05 * rng.randn(count, cols)).astype(np.float32)
+
+    if kind == 'video':
+        height, width, channels = VIDEO_FRAME
+        frames = rng.randint(0, 64, (count, height, width, channels)).astype(np.uint8)
+        # a bright square moving along a circle, something to track
+        phase = 2 * np.pi * (start + np.arange(count)) / 250.0
+        ys = (height / 2 + height / 3 * np.sin(phase)).astype(int)
+        xs = (width / 2 + width / 3 * np.cos(phase)).astype(int)
+        for frame, y, x in zip(frames, ys, xs):
+            frame[y - 8:y + 8, x - 8:x + 8] = 255
+        return frames
+
+    if kind == 'events':
+        isi = rng.exponential(1.0 / params['rate'], count)
+        return np.cumsum(isi)
+
+    raise ValueError('Unknown kind %s' % kind)
+
+
+def write_chunks(pool, array, jobs, pending=2):
+    """
+    Writes the chunks created by <jobs> into consecutive parts of the first dimension of <array>.
+    With a pool at most <pending> chunks are created ahead of the one being written, so memory
+    stays bounded when the workers are faster than the file.
+    """
+    if pool is None:
+        for job in jobs:
+            array[job[4]:job[4] + job[5]] = chunk_data(job)
+        return
+
+    queue = collections.deque()
+    for job in jobs:
+        queue.append((job, pool.apply_async(chunk_data, (job, ))))
+        if len(queue) > pending:
+            done, result = queue.popleft()
+            array[done[4]:done[4] + done[5]] = result.get()
+    while queue:
+        done, result = queue.popleft()
+        array[done[4]:done[4] + done[5]] = result.get()
+
+
+def tree_sections(depth, breadth):
+    """
+    Number of sections in a metadata tree of the given depth and breadth.
+    """
+    return sum(breadth ** d for d in range(depth))
+
+
+def create_metadata_tree(nf, depth, breadth, properties=5):
+    """
+    Creates a metadata tree of the given depth with <breadth> subsections per section.
+    """
+    root = nf.create_section('session', 'nix.metadata.session')
+    level = [root]
+    for d in range(depth):
+        next_level = []
+        for sec in level:
+            for p in range(properties):
+                sec.create_property('param_%d' % p, float(d * properties + p)).unit = 'mV'
+            if d < depth - 1:
+                next_level.extend(sec.create_section('%s_%d' % (sec.name, b), 'nix.metadata.level_%d' % d)
+                                  for b in range(breadth))
+        level = next_level
+    return root
+
+
+def create_large_data(nf, size, seed=42, workers=1, chunk_bytes=2**24, depth=6, breadth=3, cells=None):
+    """
+    Fills <nf> with about <size> bytes of synthetic data: long sampled traces tagged by a stimulus
+    multi tag, spike time arrays with indexed features, Sample x Sample images, frame-major videos
+    and a metadata tree. Data is created chunk by chunk (in <workers> processes) and streamed into
+    the file, so memory use is bounded by the chunk size.
+
+    :param nf:          An open nix file
+    :param size:        Approximate size of the data in bytes
+    :param seed:        Seed of all random streams
+    :param workers:     Number of processes creating the data
+    :param chunk_bytes: Approximate size of the chunks written at once
+    :param depth:       Maximal depth of the metadata tree, reduced until the tree takes at most
+                        METADATA_SHARE of <size>
+    :param breadth:     Subsections per section of the metadata tree
+    :param cells:       Number of spike time arrays (default derived from the size)
+    :return:            The block
+    """
+    while depth > 1 and tree_sections(depth, breadth) * SECTION_BYTES > size * METADATA_SHARE:
+        depth -= 1
+    block = nf.create_block('synthetic', 'nix.session.synthetic')
+    block.metadata = create_metadata_tree(nf, depth, breadth)
+    size = max(0, size - tree_sections(depth, breadth) * SECTION_BYTES)
+    budget = dict((kind, int(size * share)) for kind, share in SIZE_SHARES)
+
+    pool = None
+    pending = 2
+    if workers > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers)
+        pending = 2 * workers
+
+    try:
+        stream = 0
+
+        # long sampled traces
+        trace_len = max(1000, min(budget['traces'] // 8, 2**27))
+        n_traces = max(1, budget['traces'] // (trace_len * 8))
+        per_chunk = max(1, chunk_bytes // 8)
+        traces = []
+        for i in range(n_traces):
+            stream += 1
+            array = block.create_data_array('trace %03d' % i, 'nix.regular_sampled.time_series',
+                                            dtype=nix.DataType.Double, shape=(trace_len, ))
+            array.unit = 'mV'
+            array.label = 'membrane voltage'
+            dim = array.append_sampled_dimension(TRACE_INTERVAL)
+            dim.unit = 's'
+            dim.label = 'time'
+            jobs = [('trace', seed, stream, k, a, min(per_chunk, trace_len - a), {'frequency': 1.0 + i})
+                    for k, a in enumerate(range(0, trace_len, per_chunk))]
+            write_chunks(pool, array, jobs, pending)
+            traces.append(array)
+
+        duration = trace_len * TRACE_INTERVAL
+        positions = np.arange(0.5, duration, 1.0)
+        pos = block.create_data_array('stimulus positions', 'nix.positions', data=positions)
+        pos.append_set_dimension()
+        ext = block.create_data_array('stimulus extents', 'nix.extents', data=np.full_like(positions, 0.25))
+        ext.append_set_dimension()
+        stim = block.create_multi_tag('stimulus', 'nix.stimulus', pos)
+        stim.extents = ext
+        for array in traces:
+            stim.references.append(array)
+
+        # spike times with indexed features
+        rate = 20.0
+        spikes_per_cell = max(10, int(rate * duration))
+        cells = cells or max(1, budget['events'] // (spikes_per_cell * 16 + CELL_BYTES))
+        for i in range(cells):
+            stream += 1
+            times = chunk_data(('events', seed, stream, 0, 0, spikes_per_cell, {'rate': rate}))
+            spikes = block.create_data_array('cell %04d spikes' % i, 'nix.events.spike_times', data=times)
+            spikes.unit = 's'
+            spikes.label = 'time'
+            spikes.append_set_dimension()
+            amplitude = block.create_data_array('cell %04d amplitudes' % i, 'nix.feature.amplitude',
+                                                data=np.random.RandomState([seed, stream, 1]).rand(len(times)))
+            amplitude.unit = 'mV'
+            amplitude.append_set_dimension()
+            tag = block.create_multi_tag('cell %04d' % i, 'nix.events.spike_times', spikes)
+            tag.create_feature(amplitude, nix.LinkType.Indexed)
+
+        # Sample x Sample images, none if the budget is below one 64 x 64 image
+        side = int(max(64, min(4096, np.sqrt(budget['images'] / 4.0))))
+        n_images = budget['images'] // (side * side * 4)
+        rows_per_chunk = max(1, chunk_bytes // (side * 4))
+        for i in range(n_images):
+            stream += 1
+            array = block.create_data_array('image %03d' % i, 'nix.data.sampled.DF/F', dtype=nix.DataType.Float,
+                                            shape=(side, side))
+            array.unit = 'lm'
+            array.label = 'intensity'
+            for d in range(2):
+                dim = array.append_sampled_dimension(1.0)
+                dim.unit = 'um'
+                dim.label = 'xy'[d]
+            jobs = [('image', seed, stream, k, a, min(rows_per_chunk, side - a), {'rows': side, 'cols': side})
+                    for k, a in enumerate(range(0, side, rows_per_chunk))]
+            write_chunks(pool, array, jobs, pending)
+
+        # frame-major videos, none if the budget is below one frame
+        frame_bytes = int(np.prod(VIDEO_FRAME))
+        frames = budget['video'] // frame_bytes
+        frames_per_video = max(1, min(frames, 10000))
+        frames_per_chunk = max(1, chunk_bytes // frame_bytes)
+        for i in range(frames // frames_per_video):
+            stream += 1
+            array = block.create_data_array('video %03d' % i, 'movie', dtype=nix.DataType.UInt8,
+                                            shape=(frames_per_video, ) + VIDEO_FRAME)
+            dim = array.append_range_dimension(np.arange(frames_per_video) * VIDEO_INTERVAL)
+            dim.unit = 'ms'
+            dim.label = 'time'
+            for _ in VIDEO_FRAME:
+                array.append_set_dimension()
+            jobs = [('video', seed, stream, k, a, min(frames_per_chunk, frames_per_video - a), {})
+                    for k, a in enumerate(range(0, frames_per_video, frames_per_chunk))]
+            write_chunks(pool, array, jobs, pending)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return block
+
+
 if __name__ == '__main__':
 
-    parser = argparse.ArgumentParser(description='NIX Plotter')
+    parser = argparse.ArgumentParser(description='NIX demo data generator')
     parser.add_argument('--file', dest='file', type=str, default='demo.h5')
     parser.add_argument('--leibig', dest='leibig', type=str, default=None)
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='Do not keep the parsed Leibig CSV as .npy next to it')
+    parser.add_argument('--size', dest='size', type=str, default=None,
+                        help='Also add about this much synthetic data, e.g. 500MB or 200GB')
+    parser.add_argument('--seed', dest='seed', type=int, default=42)
+    parser.add_argument('--workers', dest='workers', type=int, default=1)
+    parser.add_argument('--chunk', dest='chunk', type=str, default='16MB',
+                        help='Size of the chunks written at once')
+    parser.add_argument('--depth', dest='depth', type=int, default=6, help='Depth of the metadata tree')
+    parser.add_argument('--breadth', dest='breadth', type=int, default=3,
+                        help='Subsections per section of the metadata tree')
+    parser.add_argument('--cells', dest='cells', type=int, default=None, help='Number of spike time arrays')
     args = parser.parse_args()
 
     nf = nix.File.open(args.file, nix.FileMode.Overwrite)
@@ -111,5 +470,14 @@ if __name__ == '__main__':
     print('2-D, SetD+SampleD: %s' % da.id)
 
     if args.leibig is not None:
-        da = create_leibig_data(session, args.leibig)
+        da = create_leibig_data(session, args.leibig, cache=args.cache)
         print('Leibig 2-D, SampleD+SampleD: %s' % da.id)
+
+    if args.size is not None:
+        started = time.time()
+        create_large_data(nf, parse_size(args.size), seed=args.seed, workers=args.workers,
+                          chunk_bytes=parse_size(args.chunk), depth=args.depth, breadth=args.breadth,
+                          cells=args.cells)
+        print('synthetic data (%s) written in %.1fs' % (args.size, time.time() - started))
+
+    nf.close()
@@ -1,13 +1,26 @@
 #!/usr/bin/env python
+from __future__ import print_function, division
 
 import h5py
+import hashlib
+import os
 import sys
-import nix
+import nixio as nix
 import numpy as np
 
+try:
+    from instrument import Report
+except ImportError:
+    from scripts.instrument import Report
+
 SAMPLING_INTERVAL = 0.005
 SAMPLING_UNIT = "ms"
 
+BLOCK_ROWS = 2**20  # rows of a sweep read at once
+
+BLOCK_NAME = "Session 01"
+MANIFEST_NAME = "pvc-6 conversion"  # section with one property (content hash) per converted sweep
+
 index_to_time = lambda index: SAMPLING_INTERVAL * index
 index_to_time_vec = np.vectorize(index_to_time)
 
@@ -15,7 +28,7 @@ index_to_time_vec = np.vectorize(index_to_time)
 class Sweep(object):
     """Contains the data of a sweep"""
 
-    def __init__(self, name, number, data, times, durations, indexes, stimulus):
+    def __init__(self, name, number, data, times, durations, indexes, stimulus, digest=None):
         self.name = name            # the original sweep name
         self.number = number        # the sweep number
         self.data = data            # the recorded voltage
@@ -23,114 +36,270 @@ class Sweep(object):
         self.durations = durations  # the duration of each stimulus
         self.indexes = indexes      # index when the stimulus changed
         self.stimulus = stimulus    # stimulus values (injected current)
+        self.digest = digest        # content hash of the source dataset
+
+
+def open_sweep(pvc6_file, ds_name, block_rows=BLOCK_ROWS):
+    """
+    Opens a sweep dataset with a chunk cache that holds all chunks touched by one block of rows,
+    so that every chunk is read and decompressed only once. Returns None if the sweep does not exist.
+    """
+    ds = pvc6_file.get(ds_name, default=None)
+    if ds is None or ds.chunks is None:
+        return ds
+
+    chunk_rows = ds.chunks[0]
+    chunk_bytes = int(np.prod(ds.chunks)) * ds.dtype.itemsize
+    chunk_cols = -(-ds.shape[1] // ds.chunks[1]) if len(ds.shape) > 1 else 1
+    n_chunks = (-(-block_rows // chunk_rows) + 1) * chunk_cols
 
+    dapl = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+    dapl.set_chunk_cache(max(521, 10 * n_chunks + 1), n_chunks * chunk_bytes, 1.0)
+    return h5py.Dataset(h5py.h5d.open(pvc6_file.id, ds.name.encode(), dapl))
 
-def read_pvc6(in_file, start, end):
-    """Read a pvc-6 file and return an array of Sweep objects"""
-    pvc6_orig = h5py.File(in_file)
+
+def read_sweep(ds, block_rows=BLOCK_ROWS, digest=None):
+    """
+    Reads a (samples, 2) sweep dataset in one pass of contiguous row blocks (aligned to the
+    chunks) and returns the stimulus and voltage columns as views into the read buffer.
+    If given, the hashlib object <digest> is updated with each block.
+    """
+    size = ds.shape[0]
+    if ds.chunks is not None:
+        block_rows = max(ds.chunks[0], block_rows // ds.chunks[0] * ds.chunks[0])
+
+    buf = np.empty(ds.shape, dtype=ds.dtype)
+    for a in range(0, size, block_rows):
+        b = min(size, a + block_rows)
+        ds.read_direct(buf, np.s_[a:b], np.s_[a:b])
+        if digest is not None:
+            digest.update(buf[a:b])
+
+    return buf[:, 0], buf[:, 1]
+
+
+def new_digest(ds):
+    """Returns a hashlib object for the content hash of a sweep, seeded with its shape and type"""
+    digest = hashlib.sha1()
+    digest.update(("%s %s" % (ds.shape, ds.dtype.str)).encode())
+    return digest
+
+
+def read_pvc6(in_file, start, end, report=None, manifest=None):
+    """
+    Read a pvc-6 file and return an array of Sweep objects. Sweeps whose content hash
+    matches the entry in <manifest> (dict sweep name -> hash) are skipped.
+    """
+    report = report or Report('read_pvc6', memory=False)
+    pvc6_orig = h5py.File(in_file, 'r')
 
     sweeps = []
-    for sweep_no in xrange(start, end):
+    for sweep_no in range(start, end):
         ds_name = "Sweep_%d" % sweep_no
 
-        ds = pvc6_orig.get(ds_name, default=None)
+        ds = open_sweep(pvc6_orig, ds_name)
 
         if ds is None:
             break
 
-        size = ds.shape[0]
-        volt_raw = ds[0:size, 1]
-        stim_raw = ds[0:size, 0]
+        with report.stage('read'):
+            digest = new_digest(ds)
+            stim_raw, volt_raw = read_sweep(ds, digest=digest)
+            report.add(bytes_read=ds.size * ds.dtype.itemsize, items=1)
 
-        rolled = np.roll(stim_raw, 1)
-        rolled[0] = -1
+        if manifest and manifest.get(ds_name) == digest.hexdigest():
+            report.add('skipped', items=1)
+            continue
 
-        indexes = np.argwhere(stim_raw - rolled).flatten()
-        stimulus = stim_raw[indexes]
-        times = index_to_time_vec(indexes)
+        with report.stage('stimulus'):
+            sweep = make_sweep(ds_name, sweep_no, volt_raw, stim_raw)
+            sweep.digest = digest.hexdigest()
+            sweeps.append(sweep)
 
-        rolled = np.roll(times, -1)
-        rolled[-1] = index_to_time(size - 1)
-        durations = rolled - times
+    pvc6_orig.close()
+    return sweeps
 
-        sweep = Sweep(ds_name, sweep_no, volt_raw, times, durations, indexes, stimulus)
-        sweeps.append(sweep)
 
-    return sweeps
+def make_sweep(ds_name, sweep_no, volt_raw, stim_raw):
+    """Find the stimulus steps of a sweep"""
+    size = len(stim_raw)
 
+    rolled = np.roll(stim_raw, 1)
+    rolled[0] = -1
 
-def write_pvc6(sweeps, out_file):
-    """Write an array of sweeps to a nix file"""
+    indexes = np.argwhere(stim_raw - rolled).flatten()
+    stimulus = stim_raw[indexes]
+    times = index_to_time_vec(indexes)
 
-    f = nix.File.open(out_file, nix.FileMode.Overwrite)
+    rolled = np.roll(times, -1)
+    rolled[-1] = index_to_time(size - 1)
+    durations = rolled - times
 
-    # basic nix file
-    block = f.create_block("Session 01", "nix.session")
+    return Sweep(ds_name, sweep_no, volt_raw, times, durations, indexes, stimulus)
 
-    curr_tag = None
-    curr_stim = np.array([])
-    curr_times = np.array([])
 
-    # assume that all sweeps are sorted by sweep number and
-    # therefore grouped by stimulus condition (see original pvc-6 file)
-    for sweep in sweeps:
+def load_manifest(out_file):
+    """
+    Returns the manifest (dict sweep name -> content hash) of an existing nix file, restricted
+    to the sweeps that are actually stored in it. Returns an empty dict if there is no such file.
+    """
+    if not os.path.exists(out_file):
+        return {}
+
+    f = nix.File.open(out_file, nix.FileMode.ReadOnly)
+    manifest = {}
+    if MANIFEST_NAME in f.sections and BLOCK_NAME in f.blocks:
+        arrays = f.blocks[BLOCK_NAME].data_arrays
+        for prop in f.sections[MANIFEST_NAME].props:
+            number = int(prop.name.split("_")[-1])
+            if "Sweep %02d" % number in arrays:
+                manifest[prop.name] = prop.values[0]
+    f.close()
+    return manifest
 
-        print("Processing Sweep %02d / sample_count: %07d / stim_count: %05d / "
-              "stim_times_count: %05d / stim_value_count: %05d" %
-              (sweep.number, len(sweep.data), len(sweep.indexes), len(sweep.times), len(sweep.stimulus)))
 
-        if not np.array_equal(curr_stim, sweep.stimulus) or not np.array_equal(curr_times, sweep.times):
+def stimulus_key(times, durations, stimulus):
+    return tuple(np.asarray(a).tobytes() for a in (times, durations, stimulus))
 
-            curr_stim = sweep.stimulus
-            curr_times = sweep.times
 
-            pos = block.create_data_array("Stimulus Positions %02d" % sweep.number, "nix.positions",
-                                          data=sweep.times)
-            pos.label = "time"
-            pos.unit = SAMPLING_UNIT
-            pos.append_set_dimension()
+def find_stimuli(block):
+    """Returns a dict stimulus_key -> multi tag of the stimulus tags in <block>"""
+    stimuli = {}
+    for tag in block.multi_tags:
+        if tag.type == "nix.stimulus":
+            stim = tag.features[0].data
+            stimuli[stimulus_key(tag.positions[:], tag.extents[:], stim[:])] = tag
+    return stimuli
 
-            ext = block.create_data_array("Stimulus Durations %02d" % sweep.number, "nix.extents",
-                                          data=sweep.durations)
-            ext.label = "time"
-            ext.unit = SAMPLING_UNIT
-            ext.append_set_dimension()
 
-            curr_tag = block.create_multi_tag("Stimulus %02d" % sweep.number, "nix.stimulus", pos)
-            curr_tag.extents = ext
+def remove_unused_stimuli(block):
+    """Removes stimulus tags (and their arrays) that no longer reference any sweep"""
+    for tag in [t for t in block.multi_tags if t.type == "nix.stimulus" and len(t.references) == 0]:
+        arrays = [tag.positions, tag.extents] + [feat.data for feat in tag.features]
+        del block.multi_tags[tag.name]
+        for array in arrays:
+            del block.data_arrays[array.name]
 
-            stim = block.create_data_array("Stimulus Current %02d" % sweep.number, "nix.stimulus.features",
-                                           data=sweep.stimulus)
-            stim.unit = "pA"
-            stim.label = "injected current"
-            stim.append_set_dimension()
 
-            curr_tag.create_feature(stim, nix.LinkType.Indexed)
+def write_pvc6(sweeps, out_file, report=None, overwrite=True):
+    """
+    Write an array of sweeps to a nix file.
+
+    Unless <overwrite> is set, an existing file is extended: sweeps that are already stored are
+    replaced, and sweeps with a stimulus that is already stored are added to its tag. Every
+    written sweep is recorded with its content hash in the manifest section of the file.
+    """
+    report = report or Report('write_pvc6', memory=False)
 
-        volt = block.create_data_array("Sweep %02d" % sweep.number, "nix.regular_sampled.time_series",
-                                       data=sweep.data)
-        volt.unit = "mV"
-        volt.label = "membrane voltage"
-        dim = volt.append_sampled_dimension(SAMPLING_INTERVAL)
-        dim.unit = SAMPLING_UNIT
-        dim.label = "time"
+    if overwrite or not os.path.exists(out_file):
+        f = nix.File.open(out_file, nix.FileMode.Overwrite)
+    else:
+        f = nix.File.open(out_file, nix.FileMode.ReadWrite)
+
+    # basic nix file
+    if BLOCK_NAME in f.blocks:
+        block = f.blocks[BLOCK_NAME]
+    else:
+        block = f.create_block(BLOCK_NAME, "nix.session")
 
-        curr_tag.references.append(volt)
+    if MANIFEST_NAME in f.sections:
+        manifest = f.sections[MANIFEST_NAME]
+    else:
+        manifest = f.create_section(MANIFEST_NAME, "nix.conversion.manifest")
 
+    stimuli = find_stimuli(block)
+
+    # assume that all sweeps are sorted by sweep number and
+    # therefore grouped by stimulus condition (see original pvc-6 file)
+    progress = report.progress('writing sweeps', len(sweeps))
+    for sweep in sweeps:
+        name = "Sweep %02d" % sweep.number
+        if name in block.data_arrays:
+            # a modified sweep, its old version is unlinked from all tags
+            del block.data_arrays[name]
+
+        key = stimulus_key(sweep.times, sweep.durations, sweep.stimulus)
+        curr_tag = stimuli.get(key)
+
+        if curr_tag is None:
+
+            with report.stage('write stimulus'):
+                tag_name = "Stimulus %02d" % sweep.number
+                suffix = 1
+                while tag_name in block.multi_tags:
+                    suffix += 1
+                    tag_name = "Stimulus %02d.%d" % (sweep.number, suffix)
+                array_suffix = tag_name[len("Stimulus "):]
+
+                pos = block.create_data_array("Stimulus Positions " + array_suffix, "nix.positions",
+                                              data=sweep.times)
+                pos.label = "time"
+                pos.unit = SAMPLING_UNIT
+                pos.append_set_dimension()
+
+                ext = block.create_data_array("Stimulus Durations " + array_suffix, "nix.extents",
+                                              data=sweep.durations)
+                ext.label = "time"
+                ext.unit = SAMPLING_UNIT
+                ext.append_set_dimension()
+
+                curr_tag = block.create_multi_tag(tag_name, "nix.stimulus", pos)
+                curr_tag.extents = ext
+
+                stim = block.create_data_array("Stimulus Current " + array_suffix, "nix.stimulus.features",
+                                               data=sweep.stimulus)
+                stim.unit = "pA"
+                stim.label = "injected current"
+                stim.append_set_dimension()
+
+                curr_tag.create_feature(stim, nix.LinkType.Indexed)
+                stimuli[key] = curr_tag
+                report.add(bytes_written=sweep.times.nbytes + sweep.durations.nbytes + sweep.stimulus.nbytes,
+                           items=1)
+
+        with report.stage('write sweep'):
+            volt = block.create_data_array(name, "nix.regular_sampled.time_series", data=sweep.data)
+            volt.unit = "mV"
+            volt.label = "membrane voltage"
+            dim = volt.append_sampled_dimension(SAMPLING_INTERVAL)
+            dim.unit = SAMPLING_UNIT
+            dim.label = "time"
+
+            curr_tag.references.append(volt)
+            report.add(bytes_written=sweep.data.nbytes, items=1)
+
+        # record the sweep only once it is completely written, so an interrupted run resumes here
+        if sweep.digest is not None:
+            manifest[sweep.name] = sweep.digest
+        f.flush()
+
+        progress.update()
+
+    progress.close()
+    remove_unused_stimuli(block)
     f.close()
 
 
-def convert(in_file, out_file, start, end):
+def convert(in_file, out_file, start, end, report_file=None, quiet=False, memory=True, overwrite=False):
     """
-    Converts a pvc-6 example file to nix
+    Converts a pvc-6 example file to nix. An existing output file is extended: sweeps that
+    are already converted and unchanged in the source are skipped.
 
     :param in_file:     The name of the original pvc-6 file.
     :param out_file:    The name of the nix output file.
     :param start:       The number of first sweep to read.
     :param end:         The number of the sweep where reading should stop (excluding this number)
+    :param report_file: Optional name of a JSON file for the timing report
+    :param quiet:       Do not print progress and the timing summary
+    :param memory:      Trace memory allocations (slows down the conversion)
+    :param overwrite:   Replace an existing output file instead of extending it
+    :return:            The timing report (dict)
     """
-    sweeps = read_pvc6(in_file, start, end)
-    write_pvc6(sweeps, out_file)
+    report = Report('convert_pvc6', memory, quiet=quiet)
+    manifest = {} if overwrite else load_manifest(out_file)
+    sweeps = read_pvc6(in_file, start, end, report, manifest)
+    write_pvc6(sweeps, out_file, report, overwrite)
+    return report.finish(report_file, quiet)
 
 
 if __name__ == '__main__':
@@ -143,9 +312,17 @@ if __name__ == '__main__':
                         help="Output nix file")
     parser.add_argument("-s", "--start", dest="start", default=0, type=int,
                         help="The number of the first sweep to read")
-    parser.add_argument("-e", "--end", dest="end", default=sys.maxint, type=int,
+    parser.add_argument("-e", "--end", dest="end", default=sys.maxsize, type=int,
                         help="The number of the sweep where reading should stop (excludes this sweep)")
+    parser.add_argument("-r", "--report", dest="report", default=None,
+                        help="JSON file for the timing and memory report")
+    parser.add_argument("-q", "--quiet", dest="quiet", action="store_true",
+                        help="Do not print progress and the timing summary")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="Do not trace memory allocations")
+    parser.add_argument("-f", "--overwrite", dest="overwrite", action="store_true",
+                        help="Replace an existing output file instead of converting only new or modified sweeps")
 
     args = parser.parse_args()
 
-    convert(args.input, args.output, args.start, args.end)
+    convert(args.input, args.output, args.start, args.end, args.report, args.quiet, args.memory, args.overwrite)
@@ -1,13 +1,32 @@
-import nix
+from __future__ import print_function, division
+
+import os
+import nixio as nix
 import scipy.io as sp
 import numpy as np
-from IPython import embed
-import cProfile
-    
+
+try:
+    from instrument import Report
+except ImportError:
+    from scripts.instrument import Report
+
+try:
+    unicode
+except NameError:
+    unicode = str
+
+try:
+    mat_struct = sp.matlab.mat_struct
+except AttributeError:
+    mat_struct = sp.matlab.mio5_params.mat_struct
+
 
 def save_value(section, property_name, value, unit=None):
-    v = nix.Value(value)
-    p = section.create_property(property_name, [v])
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    elif isinstance(value, np.generic):
+        value = value.item()
+    p = section.create_property(property_name, value)
     if unit is not None:
         p.unit = unit
     
@@ -66,7 +85,7 @@ def convert_stim_info(stim_info, rec_no):
     for i in temp.items():
         if i[0] == "_fieldnames":
             continue
-        if isinstance(i[1], sp.matlab.mio5_params.mat_struct):
+        if isinstance(i[1], mat_struct):
             temp2 = i[1].__dict__
             info[i[0]] = {}
             for k in temp2.items():                
@@ -80,26 +99,23 @@ def convert_stim_info(stim_info, rec_no):
     return info
 
 
-def read_bit(f):
-    bytes = (ord(b) for b in f.read())
-    for b in bytes:
-        for i in xrange(8):
-            yield (b >> i) & 1
+def read_bits(f, count):
+    """
+    Reads <count> bits, least significant bit of each byte first.
+    """
+    raw = np.frombuffer(f.read((count + 7) // 8), dtype=np.uint8)
+    return np.unpackbits(raw[:, np.newaxis], axis=1)[:, ::-1].ravel()[:count]
 
 
-def load_stimulus(filename, stim_info):
-    n_frames = stim_info['Nframes'] - 1
-    n_x = stim_info['param']['x'] / stim_info['param']['dx']
-    n_y = stim_info['param']['y'] / stim_info['param']['dy']
+def load_stimulus(filename, stim_info, report=None):
+    n_frames = int(stim_info['Nframes'] - 1)
+    n_x = int(stim_info['param']['x'] / stim_info['param']['dx'])
+    n_y = int(stim_info['param']['y'] / stim_info['param']['dy'])
     m = n_x * n_y
-    count = 0
-    stim = np.zeros((m*n_frames), dtype=np.int8)
-    with open(filename, 'r') as f:
-        for b in read_bit(f):
-            stim[count] = b;
-            count += 1
-            if count >= n_frames * m:
-                break;
+    with open(filename, 'rb') as f:
+        stim = read_bits(f, n_frames * m).astype(np.int8)
+    if report is not None:
+        report.add(bytes_read=(n_frames * m + 7) // 8, items=n_frames)
     temp = np.reshape(2*stim-1, (m, n_frames), order='F')
     return temp
 
@@ -124,29 +140,68 @@ def export_stimulus(nix_file, block, stimulus, stim_section, rec_no, data_arrays
     tag.create_feature(stim_array,nix.LinkType.Tagged)
     
 
-def export_retina_data(filename, export_stim=False):
-    data = sp.loadmat(filename, struct_as_record=False, squeeze_me=True)
+def export_retina_data(filename, export_stim=False, stim_file='crcns_ret-1/ran1.bin', report_file=None,
+                       quiet=False, memory=True):
+    """
+    Converts a ret-1 .mat file into a nix file next to it.
+
+    :param filename:    The .mat file
+    :param export_stim: Also store the white noise stimulus of each recording
+    :param stim_file:   The binary stimulus file
+    :param report_file: Optional name of a JSON file for the timing report
+    :param quiet:       Do not print progress and the timing summary
+    :param memory:      Trace memory allocations (slows down the conversion)
+    :return:            The timing report (dict)
+    """
+    report = Report('convert_ret1', memory, quiet=quiet)
+    with report.stage('load mat'):
+        data = sp.loadmat(filename, struct_as_record=False, squeeze_me=True)
+        report.add(bytes_read=os.path.getsize(filename))
     nix_file = nix.File.open(filename[:-3]+'nix', nix.FileMode.Overwrite)
     name = filename.split('/')[-1][:-4]
 
+    progress = report.progress('recordings', data["spikes"].shape[1])
     for i in range(data["spikes"].shape[1]):
         block_name = name + "recording_" + str(i)
-        print block_name
         block = nix_file.create_block(block_name, 'nix.recording_session')
         spike_times = data["spikes"][:,i]
-        rec_info = convert_data_info(data['datainfo'], i)
-        stim_info = convert_stim_info(data['stimulus'], i)
-        export_data_info(nix_file, block, rec_info, block_name)
-        stim_section = export_stimulus_metadata(nix_file, block, stim_info, "stimulus_" + str(i))
-        spike_arrays = export_spikes(nix_file, block, spike_times, stim_section, i)
-        
+        with report.stage('metadata'):
+            rec_info = convert_data_info(data['datainfo'], i)
+            stim_info = convert_stim_info(data['stimulus'], i)
+            export_data_info(nix_file, block, rec_info, block_name)
+            stim_section = export_stimulus_metadata(nix_file, block, stim_info, "stimulus_" + str(i))
+        with report.stage('spikes'):
+            spike_arrays = export_spikes(nix_file, block, spike_times, stim_section, i)
+            report.add(bytes_written=sum(da.shape[0] * 4 for da in spike_arrays), items=len(spike_arrays))
+
         if export_stim:
-            stim_file = 'crcns_ret-1/ran1.bin'
-            stimulus = load_stimulus(stim_file, stim_info)
-            export_stimulus(nix_file, block, stimulus, stim_section, i, spike_arrays)    
+            with report.stage('load stimulus'):
+                stimulus = load_stimulus(stim_file, stim_info, report)
+            with report.stage('write stimulus'):
+                export_stimulus(nix_file, block, stimulus, stim_section, i, spike_arrays)
+                report.add(bytes_written=stimulus.nbytes)
+        progress.update()
+    progress.close()
     nix_file.close()
+    return report.finish(report_file, quiet)
+
 
-    
 if __name__=='__main__':
-    name = 'crcns_ret-1/Data/20080516_R1.mat'
-    export_retina_data(name, export_stim=False)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert a ret-1 .mat file to a nix file")
+    parser.add_argument("-i", "--in", dest="input", default='crcns_ret-1/Data/20080516_R1.mat',
+                        help="Input .mat file from the ret-1 dataset")
+    parser.add_argument("-s", "--stimulus", dest="stimulus", default=None,
+                        help="Also export the stimulus read from this ran1.bin file")
+    parser.add_argument("-r", "--report", dest="report", default=None,
+                        help="JSON file for the timing and memory report")
+    parser.add_argument("-q", "--quiet", dest="quiet", action="store_true",
+                        help="Do not print progress and the timing summary")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="Do not trace memory allocations")
+    args = parser.parse_args()
+
+    export_retina_data(args.input, export_stim=args.stimulus is not None,
+                       stim_file=args.stimulus or 'crcns_ret-1/ran1.bin', report_file=args.report, quiet=args.quiet,
+                       memory=args.memory)
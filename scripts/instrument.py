@@ -0,0 +1,246 @@
+"""
+Stage timers, counters and progress output for the conversion scripts.
+
+    report = Report('convert_pvc6')
+    with report.stage('read'):
+        data = ds[:]
+        report.add(bytes_read=data.nbytes, items=1)
+
+    progress = report.progress('sweeps', total=len(sweeps))
+    for sweep in sweeps:
+        ...
+        progress.update()
+    progress.close()
+
+    report.finish('report.json')    # prints a summary, writes JSON if a file name is given
+
+Stages can be nested and entered repeatedly; their times and counters add up. Memory peaks are
+measured with tracemalloc (if enabled) and the resident set size of the process.
+"""
+from __future__ import print_function, division
+
+import functools
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def max_rss():
+    """
+    Peak resident set size of the process in bytes (or None).
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def format_size(n):
+    if n is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n) < 1024 or unit == 'GB':
+            return '%.1f%s' % (n, unit)
+        n /= 1024.0
+
+
+class Progress(object):
+    """
+    Progress output that is written at most once per <interval> seconds.
+    """
+
+    def __init__(self, label, total=None, interval=1.0, stream=None, quiet=False):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.quiet = quiet
+        self.done = 0
+        self.__start = clock()
+        self.__last = self.__start
+
+    def update(self, n=1):
+        self.done += n
+        now = clock()
+        if now - self.__last >= self.interval:
+            self.__last = now
+            self.__write(now, '\r')
+
+    def close(self):
+        if self.quiet:
+            return
+        self.__write(clock(), '\r')
+        self.stream.write('\n')
+        self.stream.flush()
+
+    def __write(self, now, end):
+        if self.quiet:
+            return
+        rate = self.done / max(now - self.__start, 1e-9)
+        if self.total:
+            text = '%s: %d / %d (%.0f%%, %.1f/s)' % (self.label, self.done, self.total,
+                                                   100.0 * self.done / self.total, rate)
+        else:
+            text = '%s: %d (%.1f/s)' % (self.label, self.done, rate)
+        self.stream.write(end + text)
+        self.stream.flush()
+
+
+class Report(object):
+    """
+    Collects stage timings, byte and item counters and memory peaks of one converter run.
+    """
+
+    def __init__(self, name, memory=True, progress_interval=1.0, stream=None, quiet=False):
+        """
+        :param name:                Name of the run (e.g. the converter)
+        :param memory:              Trace python allocations with tracemalloc
+        :param progress_interval:   Minimum number of seconds between two progress lines
+        :param stream:              Stream for progress and summary (default stderr)
+        :param quiet:               Do not write progress lines
+        """
+        self.name = name
+        self.progress_interval = progress_interval
+        self.quiet = quiet
+        self.stream = stream or sys.stderr
+        self.stages = {}
+        self.order = []
+        self.__stack = []
+        self.__start = clock()
+        self.__peak = 0
+        self.__tracing = memory and tracemalloc is not None and not tracemalloc.is_tracing()
+        if self.__tracing:
+            tracemalloc.start()
+
+    def stage(self, name):
+        """
+        Context manager timing a stage. Can also be used as decorator: @report.stage('read').
+        """
+        return _Stage(self, name)
+
+    def timed(self, name=None):
+        """
+        Decorator timing every call of a function as stage <name> (default: the function name).
+        """
+        return lambda fn: self.stage(name or fn.__name__)(fn)
+
+    def add(self, stage=None, bytes_read=0, bytes_written=0, items=0):
+        """
+        Adds to the counters of <stage> (default: the innermost running stage).
+        """
+        stats = self.__stats(stage or (self.__stack[-1] if self.__stack else 'total'))
+        stats['bytes_read'] += int(bytes_read)
+        stats['bytes_written'] += int(bytes_written)
+        stats['items'] += int(items)
+
+    def progress(self, label, total=None):
+        return Progress(label, total, self.progress_interval, self.stream, self.quiet)
+
+    def result(self):
+        """
+        Returns the report as a dict.
+        """
+        peak = max(self.__peak, tracemalloc.get_traced_memory()[1]) if self.__tracing else None
+        return {
+            'name': self.name,
+            'seconds': clock() - self.__start,
+            'peak_memory': peak,
+            'max_rss': max_rss(),
+            'stages': [dict(self.stages[name], name=name) for name in self.order],
+        }
+
+    def summary(self):
+        """
+        Returns a human readable table of the stages.
+        """
+        result = self.result()
+        lines = ['%s: %.2fs, peak memory %s, max rss %s' % (self.name, result['seconds'],
+                                                            format_size(result['peak_memory']),
+                                                            format_size(result['max_rss'])),
+                 '  %-24s %6s %10s %10s %10s %10s %10s' % ('stage', 'calls', 'seconds', 'read', 'written', 'items',
+                                                           'peak mem')]
+        for s in result['stages']:
+            lines.append('  %-24s %6d %10.3f %10s %10s %10d %10s' % (s['name'], s['calls'], s['seconds'],
+                                                                    format_size(s['bytes_read']),
+                                                                    format_size(s['bytes_written']), s['items'],
+                                                                    format_size(s['peak_memory'])))
+        return '\n'.join(lines)
+
+    def finish(self, path=None, quiet=False):
+        """
+        Ends the run: prints the summary, writes the JSON report to <path> (if given) and stops tracing.
+
+        :return:    The report as dict
+        """
+        result = self.result()
+        if not quiet:
+            print(self.summary(), file=self.stream)
+        if path:
+            with open(path, 'w') as fd:
+                json.dump(result, fd, indent=2)
+        if self.__tracing:
+            tracemalloc.stop()
+            self.__tracing = False
+        return result
+
+    # private methods
+
+    def __stats(self, name):
+        if name not in self.stages:
+            self.stages[name] = {'calls': 0, 'seconds': 0.0, 'bytes_read': 0, 'bytes_written': 0, 'items': 0,
+                                 'peak_memory': None, 'max_rss': None}
+            self.order.append(name)
+        return self.stages[name]
+
+    def _enter(self, name):
+        # peaks are reset when a top level stage starts (python >= 3.9), so the peak of a nested
+        # stage includes the allocations of its outer stage up to that point
+        if self.__tracing and not self.__stack and hasattr(tracemalloc, 'reset_peak'):
+            self.__peak = max(self.__peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.__stack.append(name)
+        return clock()
+
+    def _exit(self, name, start):
+        self.__stack.pop()
+        stats = self.__stats(name)
+        stats['calls'] += 1
+        stats['seconds'] += clock() - start
+        stats['max_rss'] = max_rss()
+        if self.__tracing:
+            stats['peak_memory'] = max(stats['peak_memory'] or 0, tracemalloc.get_traced_memory()[1])
+
+
+class _Stage(object):
+
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = self.report._enter(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.report._exit(self.name, self.started)
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self.report.stage(self.name):
+                return fn(*args, **kwargs)
+        return wrapper
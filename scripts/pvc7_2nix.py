@@ -3,15 +3,18 @@ Example usage:
 python pvc7_2nix.py -p "/home/andrey/data/CRCNS/pvc-7" -s 5000 -e 6000
 """
 
+from __future__ import print_function, division
+
 import argparse
 import os
 import sys
 
-import nix
+import nixio as nix
+from instrument import Report
 from pvc7_parser import Parser
 
 
-def create_array(target_file, where, array_params, ticks):
+def create_array(target_file, where, array_params, ticks, report=None):
     """
     A helper function.
     Creates a NIX array in a given <target_file> inside a given <where> block
@@ -21,6 +24,7 @@ def create_array(target_file, where, array_params, ticks):
     :param where:           nix::Block name
     :param array_params:    list of parameters to create an array
     :param ticks:           ticks for the first dimension
+    :param report:          optional instrument.Report for counters
     :return:
     """
     target = nix.File.open(target_file, nix.FileMode.ReadWrite)
@@ -30,9 +34,12 @@ def create_array(target_file, where, array_params, ticks):
 
     data.append_range_dimension(ticks)
     data.dimensions[0].label = 'frames'
-    for i in range(len(data.data.shape) - 1):
+    for i in range(len(data.shape) - 1):
         data.append_set_dimension()
 
+    if report is not None:
+        report.add(bytes_written=array_params[-1].nbytes, items=1)
+
     target.close()
 
 
@@ -45,13 +52,20 @@ if __name__ == '__main__':
                         default='../data/pvc-7.nix.h5', help="Output nix file")
     parser.add_argument("-s", "--start", dest="start", default=0, type=int,
                         help="The number of the first sweep to read")
-    parser.add_argument("-e", "--end", dest="end", default=sys.maxint, type=int,
+    parser.add_argument("-e", "--end", dest="end", default=sys.maxsize, type=int,
                         help="The number of the sweep where reading should stop"
                              " (excludes this sweep)")
     parser.add_argument("-c", "--compression", dest="comp", default=10,
                         type=int, help="Video compression (10 will result in "
                                        "100 times)")
+    parser.add_argument("-r", "--report", dest="report", default=None,
+                        help="JSON file for the timing and memory report")
+    parser.add_argument("-q", "--quiet", dest="quiet", action="store_true",
+                        help="Do not print progress and the timing summary")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="Do not trace memory allocations")
     args = parser.parse_args()
+    report = Report('pvc7_2nix', args.memory, quiet=args.quiet)
 
     start = args.start
     end = args.end
@@ -68,29 +82,37 @@ if __name__ == '__main__':
 
     # convert 2-photon imaging
     source_file = os.path.join(l_path, 'concat_31Hz.h5')
-    data, ticks = Parser.read_imaging(source_file, start, end, resize)
+    with report.stage('read imaging'):
+        data, ticks = Parser.read_imaging(source_file, start, end, resize, report)
     params = ('concat', 'imaging', data.dtype, data.shape, data)
-    create_array(args.output, bname, params, ticks)
+    with report.stage('write imaging'):
+        create_array(args.output, bname, params, ticks, report)
 
     # convert eye movie
     videofile = os.path.join(l_path, 'eye.avi')
     framesfile = os.path.join(l_path, 'eye_times.txt')
-    data, ticks = Parser.read_movie(videofile, framesfile, start, end, resize)
+    with report.stage('read movies'):
+        data, ticks = Parser.read_movie(videofile, framesfile, start, end, resize, report)
     params = ('eye.avi', 'movie', data.dtype, data.shape, data)
-    create_array(args.output, bname, params, ticks)
+    with report.stage('write movies'):
+        create_array(args.output, bname, params, ticks, report)
 
     # convert mouse movie
     videofile = os.path.join(l_path, 'mouse.avi')
     framesfile = os.path.join(l_path, 'mouse_times.txt')
-    data, ticks = Parser.read_movie(videofile, framesfile, start, end, resize)
+    with report.stage('read movies'):
+        data, ticks = Parser.read_movie(videofile, framesfile, start, end, resize, report)
     params = ('mouse.avi', 'movie', data.dtype, data.shape, data)
-    create_array(args.output, bname, params, ticks)
+    with report.stage('write movies'):
+        create_array(args.output, bname, params, ticks, report)
 
     # convert running speeds
     source_file = os.path.join(l_path, 'runspeed.txt')
-    data, ticks = Parser.read_speed(source_file, start, end)
+    with report.stage('read speed'):
+        data, ticks = Parser.read_speed(source_file, start, end, report)
     params = ('runspeed', 'runspeed', data.dtype, data.shape, data)
-    create_array(args.output, bname, params, ticks)
+    with report.stage('write speed'):
+        create_array(args.output, bname, params, ticks, report)
 
     target = nix.File.open(args.output, nix.FileMode.ReadWrite)
     rs = target.blocks[bname].data_arrays['runspeed']
@@ -100,7 +122,8 @@ if __name__ == '__main__':
 
     # convert stimulus
     source_file = os.path.join(l_path, 'stimulus.csv')
-    collected = Parser.read_stimulus(source_file, start, end)
+    with report.stage('read stimulus'):
+        collected = Parser.read_stimulus(source_file, start, end, report)
 
     target = nix.File.open(args.output, nix.FileMode.ReadWrite)
     block = target.blocks[bname]
@@ -119,3 +142,6 @@ if __name__ == '__main__':
 
     for name in ('concat', 'eye.avi', 'mouse.avi', 'runspeed'):
         tag.references.append(block.data_arrays[name])
+
+    target.close()
+    report.finish(args.report, args.quiet)
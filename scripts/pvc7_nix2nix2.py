@@ -0,0 +1,162 @@
+"""
+Translates a pvc-7 nix file written by pvc7_2nix.py into the nix2 layout written by
+pvc7_2nix2.py (matrix lists, a point list and a region list) without decoding the original
+video, imaging and text sources again. The data arrays are streamed in chunk aligned blocks
+of rows, so the translation runs at HDF5 copy speed and needs memory for one block only.
+
+Experimental: nix2 is not installable here, so the translation has only been checked against a
+stand-in that mimics the nix2 calls of pvc7_2nix2.py, not against nix2 itself. Compare its
+output with a file written by pvc7_2nix2.py before relying on it.
+
+Example usage:
+python pvc7_nix2nix2.py -i ../data/pvc-7.nix.h5 -o ../data/pvc-7.nix2.h5
+"""
+
+from __future__ import print_function, division
+
+import argparse
+
+import numpy as np
+import nixio as nix
+import nix2
+from instrument import Report
+
+# data arrays referenced by the recording tag, in the order of pvc7_2nix2.py
+MATRICES = ('concat', 'eye.avi', 'mouse.avi', 'runspeed')
+
+# (unit, label) of the dimensions after the time axis, by data array type
+DIMENSIONS = {
+    'imaging': (('px', 'Pixel'), ('px', 'Pixel')),
+    'movie': (('px', 'Pixel'), ('px', 'Pixel'), ('bit', 'RGB')),
+    'runspeed': (),
+}
+
+# units of the stimulus parameters (orientation, SF, TF, contrast)
+STIMULUS_UNITS = ('deg', 'mm', 'mm', 'percent')
+
+
+def iter_rows(array, block_bytes=2**26):
+    """
+    Reads a nix data array in blocks of whole rows along the first axis. The blocks are aligned
+    to the chunks of the dataset, so every chunk is read once, and share one buffer.
+
+    :param array:       The data array
+    :param block_bytes: Approximate size of a block
+    :return:            Generator of (start, stop, data); data is only valid until the next block
+    """
+    ds = array._h5group.group["data"]
+    row_bytes = max(1, ds.dtype.itemsize * int(np.prod(ds.shape[1:])))
+    rows = max(1, block_bytes // row_bytes)
+    if ds.chunks is not None:
+        rows = max(ds.chunks[0], rows // ds.chunks[0] * ds.chunks[0])
+    rows = min(rows, max(1, ds.shape[0]))
+
+    buf = np.empty((rows,) + ds.shape[1:], dtype=ds.dtype)
+    for start in range(0, ds.shape[0], rows):
+        stop = min(ds.shape[0], start + rows)
+        ds.read_direct(buf, np.s_[start:stop], np.s_[0:stop - start])
+        yield start, stop, buf[:stop - start]
+
+
+def copy_matrix(block, array, block_bytes=2**26, report=None):
+    """
+    Creates a matrix list in the nix2 <block> from a data array with a range dimension of
+    frame times and copies the data block by block.
+    """
+    ticks = np.asarray(array.dimensions[0].ticks)
+    dims = [nix2.D('ms', 'Time', scale=ticks)]
+    dims += [nix2.D(unit, label, interval=1) for unit, label in DIMENSIONS[array.type]]
+
+    mtl = block.create_matrix_list(array.name, array.type, tuple(dims), dtype=array.dtype,
+                                   size=(1,) + array.shape)
+    if array.unit:
+        mtl.unit = array.unit
+    if array.label:
+        mtl.label = array.label
+
+    progress = report.progress('copying %s' % array.name, array.shape[0]) if report is not None else None
+    for start, stop, data in iter_rows(array, block_bytes):
+        mtl.all_data[0, start:stop] = data
+        if report is not None:
+            report.add(bytes_read=data.nbytes, bytes_written=data.nbytes)
+            progress.update(stop - start)
+    if progress is not None:
+        progress.close()
+        report.add(items=1)
+
+    return mtl
+
+
+def translate(in_file, out_file, block_bytes=2**26, report_file=None, quiet=False, memory=True):
+    """
+    Translates a pvc-7 nix file into the nix2 layout.
+
+    :param in_file:     The nix file written by pvc7_2nix.py
+    :param out_file:    The nix2 output file (overwritten)
+    :param block_bytes: Approximate number of bytes copied at once
+    :param report_file: Optional name of a JSON file for the timing report
+    :param quiet:       Do not print progress and the timing summary
+    :param memory:      Trace memory allocations (slows down the translation)
+    :return:            The timing report (dict)
+    """
+    report = Report('pvc7_nix2nix2', memory, quiet=quiet)
+
+    source = nix.File.open(in_file, nix.FileMode.ReadOnly)
+    src_block = source.blocks[0]
+
+    target = nix2.File(out_file, nix2.FileMode.Overwrite)
+    block = target.create_block(src_block.name, src_block.type)
+
+    matrices = []
+    for name in MATRICES:
+        with report.stage('copy %s' % src_block.data_arrays[name].type):
+            matrices.append(copy_matrix(block, src_block.data_arrays[name], block_bytes, report))
+
+    with report.stage('tags'):
+        tag = src_block.tags['recording']
+        recording = np.column_stack((tag.position, tag.extent))
+
+        # create a reference between stimulus and recorded data
+        rec = block.create_region_list("recording", "recording", (nix2.D('ms'),), dtype=recording.dtype,
+                                       size=len(recording))
+        # nix2 requires to wrap every single value into an array
+        rec.all_data[:] = recording[:, :, np.newaxis]
+
+        # store stimulus combinations as point list
+        stim_array = tag.features[0].data
+        stimulus = stim_array[:]
+        labels = stim_array.dimensions[0].labels
+        dims = tuple(nix2.D(unit, label) for unit, label in zip(STIMULUS_UNITS, labels))
+        combinations = block.create_point_list(stim_array.name, stim_array.type, dims, dtype=stimulus.dtype,
+                                               size=len(stimulus))
+        combinations.all_data[:] = stimulus
+        report.add(bytes_read=recording.nbytes + stimulus.nbytes, items=2)
+
+        # tag all data
+        rec.add_feature_points(combinations)
+        for ml in matrices:
+            rec.add_target_matrix(ml[0])
+
+    target.close()
+    source.close()
+    return report.finish(report_file, quiet)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Translate a pvc-7 nix file into the nix2 layout')
+
+    parser.add_argument("-i", "--in", dest="input", default='../data/pvc-7.nix.h5',
+                        help="nix file written by pvc7_2nix.py")
+    parser.add_argument("-o", "--out", dest="output", default='../data/pvc-7.nix2.h5',
+                        help="Output nix2 file")
+    parser.add_argument("-b", "--block", dest="block", default=2**26, type=int,
+                        help="Approximate number of bytes copied at once")
+    parser.add_argument("-r", "--report", dest="report", default=None,
+                        help="JSON file for the timing and memory report")
+    parser.add_argument("-q", "--quiet", dest="quiet", action="store_true",
+                        help="Do not print progress and the timing summary")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="Do not trace memory allocations")
+    args = parser.parse_args()
+
+    translate(args.input, args.output, args.block, args.report, args.quiet, args.memory)
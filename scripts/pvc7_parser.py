@@ -9,12 +9,10 @@ http://docs.opencv.org/trunk/modules/highgui/doc/reading_and_writing_images_and_
 Image processing with PIL
 http://matplotlib.org/users/image_tutorial.html
 """
+from __future__ import print_function, division
 
 import h5py
 import numpy
-import cv2
-
-from PIL import Image
 
 
 class Parser(object):
@@ -31,24 +29,29 @@ class Parser(object):
         if resize is None:
             return image
 
+        from PIL import Image
+
         img = Image.fromarray(image)
-        rsize = img.resize((img.size[0]/resize, img.size[1]/resize))
+        rsize = img.resize((img.size[0] // resize, img.size[1] // resize))
 
         return numpy.asarray(rsize)
 
 
     @staticmethod
-    def read_imaging(source_file, start_index, end_index, resize=None):
+    def read_imaging(source_file, start_index, end_index, resize=None, report=None):
         """
         Read a slice [start_index, end_index] from source imaging file.
 
         :param source_file: full path to the source data file
         :param start_index: index of the first image
         :param end_index:   index of the last image
+        :param report:      optional instrument.Report for counters
         :return:
         """
         source = h5py.File(source_file, 'r')
         data = source['data'][start_index:end_index]
+        if report is not None:
+            report.add(bytes_read=data.nbytes, items=len(data))
         data = [Parser._process_image(x, resize) for x in data]
         ticks = numpy.linspace(start_index, end_index - 1, end_index - start_index)
 
@@ -57,7 +60,7 @@ class Parser(object):
         return numpy.array(data), ticks
 
     @staticmethod
-    def read_movie(videofile, framesfile, start_index, end_index, resize=None):
+    def read_movie(videofile, framesfile, start_index, end_index, resize=None, report=None):
         """
         Read a slice [start_index, end_index] of video recording.
 
@@ -65,23 +68,28 @@ class Parser(object):
         :param framesfile:  path to the mapping file
         :param start_index: index of the first image
         :param end_index:   index of the last image
+        :param report:      optional instrument.Report for counters and progress
         :return:
         """
+        import cv2
+
         cap = cv2.VideoCapture(videofile)
         frames = open(framesfile, 'r')
 
-        print('reading video %s' % videofile)
+        progress = report.progress('reading video %s' % videofile) if report is not None else None
 
         to_slice, ticks = [], []
         for line in frames.readlines():
             frame_no = int(line.split('.')[0])
             success, image = cap.read()
 
-            print "\rprocessing frame %s.." % str(frame_no),
-
             if not success:
                 break
 
+            if report is not None:
+                report.add(bytes_read=image.nbytes, items=1)
+                progress.update()
+
             if start_index <= frame_no < end_index:
                 to_slice.append(Parser._process_image(image, resize))
                 ticks.append(frame_no)
@@ -89,18 +97,22 @@ class Parser(object):
             if frame_no > end_index:
                 break
 
-        print "done"
+        if progress is not None:
+            progress.close()
+        frames.close()
+        cap.release()
 
         return numpy.array(to_slice), numpy.array(ticks, dtype=int)
 
     @staticmethod
-    def read_speed(source_file, start_index, end_index):
+    def read_speed(source_file, start_index, end_index, report=None):
         """
         Read a slice [start_index, end_index] from file with mouse speeds.
 
         :param source_file: full path to the source data file
         :param start_index: index of the first image
         :param end_index:   index of the last image
+        :param report:      optional instrument.Report for counters
         :return:
         """
         speeds = open(source_file, 'r')
@@ -112,17 +124,20 @@ class Parser(object):
                 ticks.append(i)
 
         speeds.close()
+        if report is not None:
+            report.add(items=len(to_slice))
 
         return numpy.array(to_slice), numpy.array(ticks, dtype=int)
 
     @staticmethod
-    def read_stimulus(source_file, start_index, end_index):
+    def read_stimulus(source_file, start_index, end_index, report=None):
         """
         Read a slice [start_index, end_index] from stimulus file.
 
         :param source_file: full path to the source data file
         :param start_index: index of the first image
         :param end_index:   index of the last image
+        :param report:      optional instrument.Report for counters
         :return:
         """
         stimfile = open(source_file, 'r')
@@ -134,6 +149,8 @@ class Parser(object):
             collector.append([parse(j, x) for j, x in enumerate(line.split(','))])
 
         stimfile.close()
+        if report is not None:
+            report.add(items=len(collector))
 
         collected = numpy.array(collector)
         collected = collected[collected[:,0].argsort()]  # sorting by positions
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Rewrites video data arrays stored as (height, width, channels, frames) into the frame-major
+layout (frames, height, width, channels) with one HDF5 chunk per frame. Reading a single frame
+then touches one contiguous chunk instead of the whole dataset.
+
+Example usage:
+python rechunk_video.py -i ../data/tracking_data.h5 -a video
+"""
+
+import argparse
+import shutil
+
+import numpy as np
+import nixio as nix
+
+
+def describe_dimension(dim):
+    """
+    Collects everything needed to recreate <dim> in a dict.
+    """
+    desc = {'type': dim.dimension_type}
+    if dim.dimension_type == nix.DimensionType.Set:
+        desc['labels'] = dim.labels
+        return desc
+
+    desc['label'] = dim.label
+    desc['unit'] = dim.unit
+    if dim.dimension_type == nix.DimensionType.Range:
+        desc['ticks'] = dim.ticks
+    else:
+        desc['interval'] = dim.sampling_interval
+        desc['offset'] = dim.offset
+    return desc
+
+
+def append_dimension(array, desc):
+    """
+    Appends a dimension described by <desc> (see describe_dimension) to <array>.
+    """
+    if desc['type'] == nix.DimensionType.Set:
+        dim = array.append_set_dimension()
+        if desc['labels']:
+            dim.labels = desc['labels']
+        return dim
+
+    if desc['type'] == nix.DimensionType.Range:
+        dim = array.append_range_dimension(desc['ticks'])
+    else:
+        dim = array.append_sampled_dimension(desc['interval'])
+        dim.offset = desc['offset']
+    dim.label = desc['label']
+    dim.unit = desc['unit']
+    return dim
+
+
+def rewrite_frame_major(array, block=64):
+    """
+    Rewrites the data of a video array frame-major with per-frame chunks. The dimensions are
+    reordered accordingly.
+
+    :param array:   Video data array with the frames in the last dimension
+    :param block:   Number of frames copied at once
+    :return:        True if the array was rewritten, False if it was already frame-major
+    """
+    if array.dimensions[0].dimension_type == nix.DimensionType.Range:
+        return False
+
+    height, width, channels, nframes = array.shape
+    group = array._h5group.group
+    source = group["data"]
+
+    target = group.create_dataset("data.frames", shape=(nframes, height, width, channels),
+                                  dtype=source.dtype, chunks=(1, height, width, channels),
+                                  compression=source.compression, compression_opts=source.compression_opts)
+    for start in range(0, nframes, block):
+        stop = min(nframes, start + block)
+        target[start:stop] = np.moveaxis(source[..., start:stop], -1, 0)
+
+    del group["data"]
+    group.move("data.frames", "data")
+
+    dims = list(array.dimensions)
+    descriptions = [describe_dimension(d) for d in [dims[-1]] + dims[:-1]]
+
+    array.delete_dimensions()
+    for description in descriptions:
+        append_dimension(array, description)
+
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rewrite NIX video arrays frame-major")
+    parser.add_argument("-i", "--in", dest="input", required=True,
+                        help="NIX file with the video arrays (modified in place unless -o is given)")
+    parser.add_argument("-o", "--out", dest="output", default=None,
+                        help="Write the result to a copy of the input file")
+    parser.add_argument("-a", "--array", dest="arrays", action="append", default=None,
+                        help="Name of a video array (repeatable, default: all arrays of type 'movie' or "
+                             "named 'video')")
+    parser.add_argument("-b", "--block", dest="block", default=64, type=int,
+                        help="Number of frames copied at once")
+    args = parser.parse_args()
+
+    path = args.input
+    if args.output:
+        shutil.copy(args.input, args.output)
+        path = args.output
+
+    f = nix.File.open(path, nix.FileMode.ReadWrite)
+    for block in f.blocks:
+        for array in block.data_arrays:
+            if args.arrays is not None:
+                selected = array.name in args.arrays
+            else:
+                selected = array.type == 'movie' or array.name == 'video'
+            if not selected or len(array.shape) != 4:
+                continue
+
+            if rewrite_frame_major(array, args.block):
+                print("%s/%s: rewritten as %s" % (block.name, array.name, array.shape))
+            else:
+                print("%s/%s: already frame-major" % (block.name, array.name))
+    f.close()
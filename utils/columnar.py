@@ -0,0 +1,283 @@
+# !/usr/bin/env python
+#  -*- coding: utf-8 -*-
+"""
+Columnar export of event data (e.g. spike times of many cells) and their MultiTag features.
+
+All event arrays of a block are written into one table with the columns cell, time and one column
+per feature. Rows are sorted by cell and time and the row offsets of each cell are stored with the
+table, so queries on cell ids and time ranges only read contiguous parts of the columns.
+
+The table is either a group of chunked datasets in an HDF5 file or a directory of .npy files that
+are memory-mapped when loaded.
+
+    export_block(block, 'spikes.h5')
+    table = ColumnarTable('spikes.h5')
+    cols = table.query(cells=['RGC_3_stim_0'], t_min=10.0, t_max=20.0)
+"""
+from __future__ import print_function, division
+
+import fnmatch
+import json
+import os
+import re
+
+import numpy as np
+import nixio as nix
+
+
+def event_arrays(block, patterns=None):
+    """
+    Returns the event arrays of a block: 1-D data arrays with a set dimension that are not used as
+    extents or features of a multi tag, nor as positions of a multi tag whose type does not mark
+    events (e.g. the onsets of a 'nix.stimulus' tag). <patterns> optionally restricts the names (globs).
+    """
+    excluded = set()
+    for tag in block.multi_tags:
+        if 'event' not in (tag.type or ''):
+            excluded.add(tag.positions.id)
+        if tag.extents is not None:
+            excluded.add(tag.extents.id)
+        for feature in tag.features:
+            excluded.add(feature.data.id)
+
+    arrays = []
+    for da in block.data_arrays:
+        if len(da.shape) != 1 or da.id in excluded:
+            continue
+        if da.dimensions[0].dimension_type != nix.DimensionType.Set:
+            continue
+        if patterns and not any(fnmatch.fnmatchcase(da.name, p) for p in patterns):
+            continue
+        arrays.append(da)
+    return arrays
+
+
+def feature_name(name):
+    return re.sub(r'[^\w]+', '_', name).strip('_') or 'feature'
+
+
+def tags_by_positions(block):
+    """
+    Returns a dict positions array id -> multi tags using that array as positions.
+    """
+    tags = {}
+    for tag in block.multi_tags:
+        tags.setdefault(tag.positions.id, []).append(tag)
+    return tags
+
+
+def event_features(tags, times, key='type'):
+    """
+    Collects the features that <tags> (the multi tags of one event array) link to each event.
+
+    Indexed features give one value (or one row) per event, tagged and untagged features on a
+    sampled 1-D array give the value of that array at the event time. The columns are named after
+    the type of the feature data (or after its name with key='name'), so that the per-cell feature
+    arrays written by the converters end up in the same column.
+
+    :param tags:    The multi tags
+    :param times:   The event times
+    :param key:     'type' or 'name'
+    :return:        Dict column name -> values (one per event)
+    """
+    columns = {}
+    for tag in tags:
+        for feature in tag.features:
+            data = feature.data
+            name = feature_name(data.type if key == 'type' and data.type else data.name)
+            if name in columns:
+                name = feature_name(data.name)
+
+            if feature.link_type == nix.LinkType.Indexed:
+                values = np.asarray(data[:len(times)], dtype=np.float64)
+                if values.ndim == 1:
+                    columns[name] = values
+                else:
+                    for k in range(values.shape[1]):
+                        columns['%s_%d' % (name, k)] = values[:, k]
+
+            elif len(data.shape) == 1 and data.dimensions[0].dimension_type == nix.DimensionType.Sample:
+                dim = data.dimensions[0]
+                index = np.round((times - (dim.offset or 0)) / dim.sampling_interval).astype(np.int64)
+                index = np.clip(index, 0, data.shape[0] - 1)
+                if len(index):
+                    lo, hi = index.min(), index.max() + 1
+                    columns[name] = np.asarray(data[lo:hi], dtype=np.float64)[index - lo]
+                else:
+                    columns[name] = np.zeros(0)
+
+    return columns
+
+
+def export_block(block, path, patterns=None, compression='gzip', key='type'):
+    """
+    Writes all event arrays of a block with their features into one columnar table.
+
+    :param block:       The block
+    :param path:        Target; a file ending with .h5/.hdf5/.nix is written as HDF5, anything else
+                        as a directory of .npy files
+    :param patterns:    Optional name globs of the event arrays to export
+    :param compression: HDF5 compression filter (None for uncompressed)
+    :param key:         Name the feature columns after the 'type' or the 'name' of the feature data
+    :return:            Number of rows written
+    """
+    arrays = event_arrays(block, patterns)
+    tags = tags_by_positions(block)
+    sizes = np.array([da.shape[0] for da in arrays], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    total = int(offsets[-1])
+
+    # the feature columns are only known after looking at the tags of every array
+    names = set()
+    for da in arrays:
+        names.update(event_features(tags.get(da.id, ()), np.zeros(0), key))
+    columns = ['cell', 'time'] + sorted(names)
+
+    writer = _Writer(path, columns, total, compression)
+    try:
+        for i, da in enumerate(arrays):
+            times = np.asarray(da[:], dtype=np.float64)
+            order = np.argsort(times, kind='mergesort')
+            values = event_features(tags.get(da.id, ()), times, key)
+
+            a, b = offsets[i], offsets[i + 1]
+            writer.write('cell', a, b, np.full(len(times), i, dtype=np.int32))
+            writer.write('time', a, b, times[order])
+            for name in columns[2:]:
+                column = values.get(name)
+                column = column[order] if column is not None else np.full(len(times), np.nan)
+                writer.write(name, a, b, column)
+
+        writer.close({'cells': [da.name for da in arrays], 'offsets': offsets.tolist(), 'columns': columns,
+                      'block': block.name})
+    except Exception:
+        writer.abort()
+        raise
+
+    return total
+
+
+class _Writer(object):
+
+    def __init__(self, path, columns, total, compression):
+        self.hdf5 = os.path.splitext(path)[1].lower() in ('.h5', '.hdf5', '.nix')
+        self.path = path
+
+        if self.hdf5:
+            import h5py
+            self.file = h5py.File(path, 'w')
+            chunk = (min(max(total, 1), 2**16),)
+            self.columns = {}
+            for name in columns:
+                dtype = np.int32 if name == 'cell' else np.float64
+                self.columns[name] = self.file.create_dataset(name, shape=(total,), dtype=dtype, chunks=chunk,
+                                                              compression=compression)
+        else:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.columns = {}
+            for name in columns:
+                dtype = np.int32 if name == 'cell' else np.float64
+                self.columns[name] = np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+',
+                                                               dtype=dtype, shape=(total,))
+
+    def write(self, name, start, stop, values):
+        self.columns[name][start:stop] = values
+
+    def close(self, meta):
+        if self.hdf5:
+            self.file.attrs['meta'] = json.dumps(meta)
+            self.file.close()
+        else:
+            for column in self.columns.values():
+                column.flush()
+            with open(os.path.join(self.path, 'meta.json'), 'w') as fd:
+                json.dump(meta, fd)
+        self.columns = {}
+
+    def abort(self):
+        if self.hdf5:
+            self.file.close()
+        self.columns = {}
+
+
+class ColumnarTable(object):
+    """
+    Read access to a table written by export_block with predicate pushdown on cells and time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hdf5 = os.path.isfile(path)
+
+        if self.hdf5:
+            import h5py
+            self.file = h5py.File(path, 'r')
+            meta = json.loads(self.file.attrs['meta'])
+            self.__columns = dict((name, self.file[name]) for name in meta['columns'])
+        else:
+            self.file = None
+            with open(os.path.join(path, 'meta.json'), 'r') as fd:
+                meta = json.load(fd)
+            self.__columns = dict((name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r'))
+                                  for name in meta['columns'])
+
+        self.cells = meta['cells']
+        self.offsets = np.array(meta['offsets'], dtype=np.int64)
+        self.columns = meta['columns']
+        self.__cell_ids = dict((name, i) for i, name in enumerate(self.cells))
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def column(self, name):
+        """
+        Returns the full column (h5py dataset or memmap, nothing is read yet).
+        """
+        return self.__columns[name]
+
+    def row_ranges(self, cells=None, t_min=None, t_max=None):
+        """
+        Returns the (start, stop) row ranges selected by the cells (names or ids) and the time range.
+        """
+        if cells is None:
+            ids = range(len(self.cells))
+        else:
+            ids = sorted(set(self.__cell_ids[c] if not isinstance(c, (int, np.integer)) else int(c)
+                             for c in cells))
+
+        time = self.__columns['time']
+        ranges = []
+        for i in ids:
+            a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+            if a == b:
+                continue
+            if t_min is not None or t_max is not None:
+                times = np.asarray(time[a:b])
+                lo = np.searchsorted(times, t_min, 'left') if t_min is not None else 0
+                hi = np.searchsorted(times, t_max, 'right') if t_max is not None else b - a
+                a, b = a + int(lo), a + int(hi)
+            if b > a:
+                if ranges and ranges[-1][1] == a:
+                    ranges[-1] = (ranges[-1][0], b)
+                else:
+                    ranges.append((a, b))
+        return ranges
+
+    def query(self, cells=None, t_min=None, t_max=None, columns=None):
+        """
+        Reads the rows of the given cells (names or ids) within [t_min, t_max].
+
+        :return:    Dict column name -> values
+        """
+        ranges = self.row_ranges(cells, t_min, t_max)
+        result = {}
+        for name in columns or self.columns:
+            column = self.__columns[name]
+            parts = [np.asarray(column[a:b]) for a, b in ranges]
+            result[name] = np.concatenate(parts) if parts else np.zeros(0, dtype=column.dtype)
+        return result
@@ -0,0 +1,175 @@
+# !/usr/bin/env python
+#  -*- coding: utf-8 -*-
+"""
+Cut the epochs tagged by a Tag or MultiTag out of a sampled data array.
+
+All positions are converted to index ranges at once and neighbouring ranges are merged into a few
+large reads, so that thousands of epochs cost about one pass over the data.
+
+    epochs, time = tag_epochs(block.multi_tags['Stimulus 01'], block.data_arrays['Sweep 01'])
+"""
+from __future__ import print_function, division
+
+import numpy as np
+import nixio as nix
+
+from .memmap import data_view
+
+
+def tag_positions(tag):
+    """
+    Returns positions and extents (or None) of a Tag or MultiTag along the first dimension.
+    """
+    if hasattr(tag, 'positions'):
+        positions = np.asarray(tag.positions[:], dtype=np.float64)
+        extents = np.asarray(tag.extents[:], dtype=np.float64) if tag.extents is not None else None
+    else:
+        positions = np.asarray(tag.position, dtype=np.float64)[np.newaxis]
+        extents = np.asarray(tag.extent, dtype=np.float64)[np.newaxis] if tag.extent else None
+
+    if positions.ndim > 1:
+        positions = positions[:, 0]
+    if extents is not None and extents.ndim > 1:
+        extents = extents[:, 0]
+    return positions, extents
+
+
+def epoch_indices(dim, size, positions, extents=None, pre=0.0, post=0.0, duration=None, clip=True):
+    """
+    Converts epochs given in units of a sampled dimension into index ranges.
+
+    :param dim:         The sampled dimension
+    :param size:        Number of samples along the dimension
+    :param positions:   Start of each epoch
+    :param extents:     Length of each epoch (or None to use <duration> for all)
+    :param pre:         Time added before each position
+    :param post:        Time added after each epoch
+    :param duration:    Fixed length of all epochs, overrides <extents>
+    :param clip:        Clip the ranges to the data
+    :return:            Tuple (starts, stops) of index arrays
+    """
+    assert dim.dimension_type == nix.DimensionType.Sample, "Unsupported data"
+
+    positions = np.asarray(positions, dtype=np.float64)
+    if duration is not None:
+        extents = np.full_like(positions, duration)
+    elif extents is None:
+        extents = np.zeros_like(positions)
+
+    offset = dim.offset or 0
+    interval = dim.sampling_interval
+    starts = np.round((positions - pre - offset) / interval).astype(np.int64)
+    stops = np.round((positions + extents + post - offset) / interval).astype(np.int64)
+
+    if not clip:
+        return starts, stops
+    return np.clip(starts, 0, size), np.clip(np.maximum(stops, starts), 0, size)
+
+
+def coalesce(starts, stops, max_gap=4096, max_read=2**24):
+    """
+    Merges index ranges that overlap or lie less than <max_gap> samples apart.
+
+    :param starts:      Start index of each range
+    :param stops:       Stop index of each range
+    :param max_gap:     Ranges closer than this are read together
+    :param max_read:    A merged range does not grow beyond this many samples
+    :return:            Tuple (read_starts, read_stops, group) where group gives the merged
+                        range each input range belongs to
+    """
+    starts = np.asarray(starts)
+    stops = np.asarray(stops)
+    order = np.argsort(starts, kind='mergesort')
+
+    group = np.empty(len(starts), dtype=np.intp)
+    read_starts, read_stops = [], []
+    for i in order:
+        if read_starts and starts[i] - read_stops[-1] <= max_gap and \
+                max(stops[i], read_stops[-1]) - read_starts[-1] <= max_read:
+            read_stops[-1] = max(read_stops[-1], stops[i])
+        else:
+            read_starts.append(starts[i])
+            read_stops.append(stops[i])
+        group[i] = len(read_starts) - 1
+
+    return np.array(read_starts, dtype=np.int64), np.array(read_stops, dtype=np.int64), group
+
+
+def read_epochs(array, starts, stops, ragged=False, fill=np.nan, max_gap=4096, max_read=2**24, offsets=None):
+    """
+    Reads the given index ranges of the first dimension of <array> with coalesced reads.
+
+    :param array:       The data array (first dimension sampled)
+    :param starts:      Start index of each epoch
+    :param stops:       Stop index of each epoch
+    :param ragged:      Return a list of arrays (views into the read buffers or into the memory map of
+                        contiguous data) instead of a padded array
+    :param fill:        Value for the padding of shorter epochs
+    :param max_gap:     See coalesce
+    :param max_read:    See coalesce
+    :param offsets:     Column of the padded array each epoch starts at (default: 0), e.g. to keep
+                        epochs clipped at the start of the data aligned with the others
+    :return:            Padded array (epochs, samples, ...) or list of arrays
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.asarray(stops, dtype=np.int64)
+    lengths = stops - starts
+    offsets = np.zeros_like(starts) if offsets is None else np.asarray(offsets, dtype=np.int64)
+    read_starts, read_stops, group = coalesce(starts, stops, max_gap, max_read)
+
+    members = np.argsort(group, kind='mergesort')
+    bounds = np.searchsorted(group[members], np.arange(len(read_starts) + 1))
+
+    if ragged:
+        epochs = [None] * len(starts)
+    else:
+        dtype = np.result_type(array.dtype, np.asarray(fill).dtype)
+        epochs = np.full((len(starts), (offsets + lengths).max() if len(starts) else 0) + tuple(array.shape[1:]),
+                         fill, dtype=dtype)
+
+    source = data_view(array)
+    for k, (a, b) in enumerate(zip(read_starts, read_stops)):
+        buf = np.asarray(source[a:b]) if b > a else np.empty((0,) + tuple(array.shape[1:]), dtype=array.dtype)
+        for i in members[bounds[k]:bounds[k + 1]]:
+            view = buf[starts[i] - a:stops[i] - a]
+            if ragged:
+                epochs[i] = view
+            else:
+                epochs[i, offsets[i]:offsets[i] + len(view)] = view
+
+    return epochs
+
+
+def tag_epochs(tag, array, pre=0.0, post=0.0, duration=None, ragged=False, fill=np.nan, max_gap=4096):
+    """
+    Returns the epochs of a sampled data array tagged by a Tag or MultiTag.
+
+    Positions and extents have to be given in the unit of the array's first (sampled) dimension.
+
+    :param tag:         Tag or MultiTag
+    :param array:       The referenced data array
+    :param pre:         Time to include before each position
+    :param post:        Time to include after each epoch
+    :param duration:    Fixed epoch length (instead of the tag's extents)
+    :param ragged:      Return a list of arrays instead of a padded array
+    :param fill:        Padding value for shorter epochs
+    :param max_gap:     Epochs closer than this many samples are read together
+    :return:            Tuple (epochs, time) where time is the time axis of the padded epochs
+                        relative to the positions (or, if ragged, the time of the first sample of
+                        each epoch relative to its position). Epochs that begin before the data
+                        are padded at the front, so that they stay aligned with the time axis.
+    """
+    dim = array.dimensions[0]
+    size = array.shape[0]
+    positions, extents = tag_positions(tag)
+    raw_starts, raw_stops = epoch_indices(dim, size, positions, extents, pre, post, duration, clip=False)
+    starts = np.clip(raw_starts, 0, size)
+    stops = np.clip(np.maximum(raw_stops, raw_starts), 0, size)
+    # samples missing before the start of the data (none for epochs without any data)
+    offsets = np.where(stops > starts, starts - raw_starts, 0)
+    epochs = read_epochs(array, starts, stops, ragged=ragged, fill=fill, max_gap=max_gap, offsets=offsets)
+
+    if ragged:
+        return epochs, offsets * dim.sampling_interval - pre
+
+    return epochs, np.arange(epochs.shape[1]) * dim.sampling_interval - pre
@@ -0,0 +1,230 @@
+# !/usr/bin/env python
+#  -*- coding: utf-8 -*-
+"""
+Inventory of all entities in a NIX file.
+
+The file is walked once and every block, data array, tag, multi tag, source and section is recorded
+with its name, type, id and path. Lookups by name, type or id are then dictionary lookups instead of
+linear scans over the entities. The inventory is stored next to the file as a JSON sidecar and reused
+as long as the modification time and size of the file do not change.
+
+    inv = Inventory.load('data/tracking_data.h5')
+    entry = inv.find(kind='multi_tag', name='tracking')[0]
+    movies = inv.find(type='movie')
+"""
+from __future__ import print_function, division
+
+import json
+import os
+
+import numpy as np
+import nixio as nix
+
+INVENTORY_VERSION = 1
+
+CONTAINERS = {
+    'data_array': 'data_arrays',
+    'tag': 'tags',
+    'multi_tag': 'multi_tags',
+    'source': 'sources',
+    'section': 'sections',
+}
+
+
+def sidecar_name(filename):
+    return filename + '.inventory.json'
+
+
+def file_key(filename):
+    st = os.stat(filename)
+    return {'version': INVENTORY_VERSION, 'mtime': st.st_mtime, 'size': st.st_size}
+
+
+def describe_dimensions(array):
+    dims = []
+    for dim in array.dimensions:
+        d = {'type': str(getattr(dim.dimension_type, 'value', dim.dimension_type))}
+        if dim.dimension_type == nix.DimensionType.Sample:
+            d.update(interval=dim.sampling_interval, offset=dim.offset, label=dim.label, unit=dim.unit)
+        elif dim.dimension_type == nix.DimensionType.Range:
+            d.update(label=dim.label, unit=dim.unit)
+        dims.append(d)
+    return dims
+
+
+class Inventory(object):
+    """
+    Name, type and id index over all entities of a NIX file.
+    """
+
+    def __init__(self, filename, entries, key=None):
+        """
+        :param filename:    The NIX file the inventory belongs to
+        :param entries:     List of entity descriptions (dicts)
+        :param key:         File key (version, mtime, size) the entries were built for
+        """
+        self.filename = filename
+        self.entries = entries
+        self.key = key
+
+        self.__by_id = {}
+        self.__by_name = {}
+        self.__by_type = {}
+        for i, entry in enumerate(entries):
+            self.__by_id[entry['id']] = i
+            self.__by_name.setdefault(entry['name'], []).append(i)
+            self.__by_type.setdefault(entry['type'], []).append(i)
+
+    # construction
+
+    @classmethod
+    def build(cls, filename):
+        """
+        Walks the NIX file once and collects all entities.
+        """
+        key = file_key(filename)
+        entries = []
+
+        nf = nix.File.open(filename, nix.FileMode.ReadOnly)
+        try:
+            for block in nf.blocks:
+                entries.append(cls.__entry('block', block, block.name, None))
+
+                for array in block.data_arrays:
+                    entry = cls.__entry('data_array', array, block.name + '/data_arrays/' + array.name, block.name)
+                    entry.update(shape=list(array.shape), dtype=np.dtype(array.dtype).name,
+                                 dimensions=describe_dimensions(array), unit=array.unit, label=array.label)
+                    entries.append(entry)
+
+                for tag in block.tags:
+                    entries.append(cls.__entry('tag', tag, block.name + '/tags/' + tag.name, block.name))
+
+                for tag in block.multi_tags:
+                    entry = cls.__entry('multi_tag', tag, block.name + '/multi_tags/' + tag.name, block.name)
+                    entry.update(positions=tag.positions.name, references=[r.name for r in tag.references])
+                    entries.append(entry)
+
+                cls.__walk(entries, 'source', block.sources, block.name + '/sources', block.name)
+
+            cls.__walk(entries, 'section', nf.sections, 'metadata', None)
+        finally:
+            nf.close()
+
+        return cls(filename, entries, key)
+
+    @classmethod
+    def load(cls, filename, cache=True):
+        """
+        Returns the inventory of a file, from its sidecar if it is still valid. Otherwise the
+        inventory is built and (if <cache> is True) written to the sidecar.
+        """
+        key = file_key(filename)
+        sidecar = sidecar_name(filename)
+
+        if cache and os.path.exists(sidecar):
+            try:
+                with open(sidecar, 'r') as fd:
+                    stored = json.load(fd)
+                if stored.get('key') == key:
+                    return cls(filename, stored['entries'], key)
+            except (IOError, OSError, ValueError, KeyError):
+                pass
+
+        inventory = cls.build(filename)
+        if cache:
+            # a read-only archive just has no sidecar, the inventory is used from memory
+            try:
+                inventory.save()
+            except (IOError, OSError):
+                pass
+        return inventory
+
+    def save(self, sidecar=None):
+        sidecar = sidecar or sidecar_name(self.filename)
+        tmp = sidecar + '.tmp'
+        with open(tmp, 'w') as fd:
+            json.dump({'key': self.key, 'entries': self.entries}, fd)
+        getattr(os, 'replace', os.rename)(tmp, sidecar)
+
+    # queries
+
+    def get(self, entity_id):
+        """
+        Returns the entry of the entity with the given id or None.
+        """
+        i = self.__by_id.get(entity_id)
+        return None if i is None else self.entries[i]
+
+    def find(self, kind=None, name=None, type=None, block=None):
+        """
+        Returns all entries matching the given kind ('block', 'data_array', 'tag', 'multi_tag',
+        'source' or 'section'), name, type and block name.
+        """
+        if name is not None and type is not None:
+            candidates = sorted(set(self.__by_name.get(name, ())) & set(self.__by_type.get(type, ())))
+        elif name is not None:
+            candidates = self.__by_name.get(name, ())
+        elif type is not None:
+            candidates = self.__by_type.get(type, ())
+        else:
+            candidates = range(len(self.entries))
+
+        result = []
+        for i in candidates:
+            entry = self.entries[i]
+            if kind is not None and entry['kind'] != kind:
+                continue
+            if block is not None and entry['block'] != block:
+                continue
+            result.append(entry)
+        return result
+
+    def types(self, kind=None):
+        """
+        Returns a dict type -> number of entities (of the given kind).
+        """
+        counts = {}
+        for t, indices in self.__by_type.items():
+            n = sum(1 for i in indices if kind is None or self.entries[i]['kind'] == kind)
+            if n:
+                counts[t] = n
+        return counts
+
+    def resolve(self, nix_file, entry):
+        """
+        Opens the entity described by <entry> in an open nix file, using keyed access only.
+        """
+        parts = entry['path'].split('/')
+        if entry['kind'] == 'block':
+            return nix_file.blocks[parts[0]]
+
+        if entry['kind'] == 'section':
+            obj = nix_file
+            for name in parts[1::2]:
+                obj = obj.sections[name]
+            return obj
+
+        obj = nix_file.blocks[parts[0]]
+        for container, name in zip(parts[1::2], parts[2::2]):
+            obj = getattr(obj, container)[name]
+        return obj
+
+    def __len__(self):
+        return len(self.entries)
+
+    # private methods
+
+    @staticmethod
+    def __entry(kind, entity, path, block):
+        return {'kind': kind, 'name': entity.name, 'type': entity.type, 'id': entity.id,
+                'path': path, 'block': block}
+
+    @staticmethod
+    def __walk(entries, kind, items, path, block):
+        for item in items:
+            item_path = path + '/' + item.name
+            entry = Inventory.__entry(kind, item, item_path, block)
+            if kind == 'section':
+                entry['properties'] = [p.name for p in item.props]
+            entries.append(entry)
+            Inventory.__walk(entries, kind, getattr(item, CONTAINERS[kind]), item_path + '/' + CONTAINERS[kind], block)
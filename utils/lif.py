@@ -83,6 +83,122 @@ class lif:
         return time, np.array(self.membrane_voltage), np.array(self.spike_times)
 
 
+    def _trajectory(self, s, v, i_a, stimulus):
+        """
+        closed form solution of the membrane equation without noise: the voltage <s> seconds
+        after a state (v, i_a) under constant input <stimulus> (offset included)
+        """
+        decay_m = np.exp(-s/self.tau_m)
+        if self.tau_a == self.tau_m:
+            adaptation = s/self.tau_m * decay_m
+        else:
+            adaptation = self.tau_a/(self.tau_a - self.tau_m) * (np.exp(-s/self.tau_a) - decay_m)
+        return stimulus + (v - stimulus) * decay_m - i_a * adaptation
+
+
+    def _next_spike(self, v, i_a, stimulus, duration):
+        """
+        time of the first threshold crossing within <duration> seconds after the state (v, i_a)
+        under constant input, or None
+        """
+        if i_a == 0.0:
+            if stimulus <= self.v_threshold:
+                return None
+            s = self.tau_m * np.log((stimulus - v)/(stimulus - self.v_threshold))
+            return s if s <= duration else None
+
+        # the trajectory has at most one extremum, the first crossing lies before or after it
+        c_m = (stimulus - v)/self.tau_m
+        if self.tau_a == self.tau_m:
+            extremum = self.tau_m * (1.0 + (v - stimulus)/i_a)
+        else:
+            c_m -= i_a*self.tau_a/((self.tau_a - self.tau_m)*self.tau_m)
+            c_a = i_a/(self.tau_a - self.tau_m)
+            ratio = -c_a/c_m if c_m != 0.0 else -1.0
+            extremum = np.log(ratio)/(1.0/self.tau_a - 1.0/self.tau_m) if ratio > 0 else -1.0
+
+        for lo, hi in ((0.0, extremum), (0.0, duration)):
+            hi = min(hi, duration)
+            if hi <= 0.0 or self._trajectory(hi, v, i_a, stimulus) <= self.v_threshold:
+                continue
+            for _ in range(100):
+                mid = 0.5 * (lo + hi)
+                if mid <= lo or mid >= hi:
+                    break
+                if self._trajectory(mid, v, i_a, stimulus) > self.v_threshold:
+                    hi = mid
+                else:
+                    lo = mid
+            return hi
+        return None
+
+
+    def run_exact(self, steps, stimulus, voltage=False):
+        """
+        exact, event-driven lif simulation without noise (D == 0). <stimulus> is constant or
+        a trace with one value per step that is taken as piecewise constant. the membrane
+        equation is solved in closed form from spike to spike, so the costs grow with the number
+        of spikes and stimulus changes instead of the number of steps. the spike times are not
+        bound to the step grid. with <voltage> the membrane voltage is sampled at the end of
+        every step like in run_stimulus, otherwise time and voltage are None. for a trace <steps>
+        may be None, otherwise it has to equal the length of the trace.
+        """
+        if self.D != 0.0:
+            raise ValueError("the exact solution requires D == 0")
+        self._reset()
+
+        if np.ndim(stimulus) == 0:
+            values = np.array([stimulus], dtype=float)
+            starts = np.array([0])
+        else:
+            trace = np.asarray(stimulus, dtype=float)
+            if steps is not None and steps != len(trace):
+                raise ValueError("stimulus trace has %d values for %d steps" % (len(trace), steps))
+            steps = len(trace)
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(trace)) + 1))[:steps]
+            values = trace[starts]
+
+        if steps == 0:
+            return (np.zeros(0), np.zeros(0), np.zeros(0)) if voltage else (None, None, np.zeros(0))
+        bounds = np.append(starts, steps) * self.stepsize
+
+        # state at the beginning of every piece of closed form solution
+        pieces = ([], [], [], [])
+        for start, end, value in zip(bounds[:-1], bounds[1:], values + self.offset):
+            t = start
+            while True:
+                for piece, x in zip(pieces, (t, self.v, self.i_a, value)):
+                    piece.append(x)
+                s = self._next_spike(self.v, self.i_a, value, end - t)
+                if s is None:
+                    break
+                t += s
+                self.spike_times.append(t)
+                self.v = self.v_reset
+                self.i_a = self.i_a * np.exp(-s/self.tau_a) + self.da
+            s = end - t
+            self.v = self._trajectory(s, self.v, self.i_a, value)
+            self.i_a *= np.exp(-s/self.tau_a)
+        self.t = bounds[-1]
+        spike_times = np.array(self.spike_times)
+
+        if not voltage:
+            return None, None, spike_times
+
+        t0, v0, a0, value = [np.array(piece) for piece in pieces]
+        samples = (np.arange(steps) + 1) * self.stepsize
+        index = np.searchsorted(t0, samples, side='left') - 1
+        index[index < 0] = 0
+        s = samples - t0[index]
+        membrane_voltage = self._trajectory(s, v0[index], a0[index], value[index])
+        spiked = np.ceil(spike_times/self.stepsize - 1e-9).astype(int) - 1
+        membrane_voltage[spiked[(spiked >= 0) & (spiked < steps)]] = 2.0
+        self.membrane_voltage = membrane_voltage.tolist()
+
+        time = np.arange(steps)*self.stepsize
+        return time, membrane_voltage, spike_times
+
+
     def __str__(self):
         out = '\n'.join(["stepsize: \t" + str(self.stepsize),
                          "offset:\t\t" + str(self.offset),
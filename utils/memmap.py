@@ -0,0 +1,100 @@
+# !/usr/bin/env python
+#  -*- coding: utf-8 -*-
+"""
+Zero-copy read access to data arrays stored contiguously and uncompressed.
+
+Such data is a plain block of bytes in the HDF5 file, so it can be mapped into memory directly:
+slicing the map returns views served from the page cache instead of new copies. Chunked or
+compressed data (the nixio default) is read through h5py as usual.
+
+    data = data_view(block.data_arrays['trace 000'])
+    window = data[10000:20000]      # a view, nothing is copied
+
+Existing chunked arrays can be rewritten contiguously with make_contiguous (they cannot grow
+afterwards).
+"""
+from __future__ import print_function, division
+
+import numpy as np
+
+# HDF5 drivers that keep the file as a single file on disk
+MAPPABLE_DRIVERS = (None, 'sec2', 'stdio')
+
+
+def h5_dataset(array):
+    """
+    Returns the h5py dataset holding the data of a nix data array.
+    """
+    return array._h5group.group["data"]
+
+
+def data_offset(array):
+    """
+    Returns the file offset of the data of <array> if it can be memory-mapped, None otherwise.
+    """
+    ds = h5_dataset(array)
+    if ds.chunks is not None or ds.compression is not None or ds.external or ds.size == 0:
+        return None
+    if ds.dtype.kind not in 'biufc' or ds.dtype.hasobject:
+        return None
+    if ds.file.driver not in MAPPABLE_DRIVERS:
+        return None
+    # data arrays with a polynomial or expansion origin are calibrated when read through nixio
+    if getattr(array, 'polynom_coefficients', None) or getattr(array, 'expansion_origin', None) is not None:
+        return None
+    try:
+        return ds.id.get_offset()
+    except Exception:
+        return None
+
+
+def memmap(array):
+    """
+    Returns a read-only numpy.memmap of the data of <array> or None if the data is chunked,
+    compressed, not allocated yet or not stored as plain numbers.
+    """
+    offset = data_offset(array)
+    if offset is None:
+        return None
+    ds = h5_dataset(array)
+    return np.memmap(ds.file.filename, dtype=ds.dtype, mode='r', offset=offset, shape=ds.shape, order='C')
+
+
+def data_view(array):
+    """
+    Returns an object to slice the data of <array> with: a memmap if possible, otherwise the data
+    array itself. Anything that is not a nix data array (e.g. a numpy array) is returned unchanged.
+    """
+    if not hasattr(array, '_h5group'):
+        return array
+    view = memmap(array)
+    return array if view is None else view
+
+
+def make_contiguous(array, block_bytes=2**26):
+    """
+    Rewrites the data of a (chunked, uncompressed or compressed) data array as one contiguous,
+    uncompressed dataset, so that data_view can map it. The file has to be open for writing.
+
+    :param array:       The data array
+    :param block_bytes: Approximate number of bytes copied at once
+    :return:            True if the data was rewritten, False if it already was contiguous
+    """
+    group = array._h5group.group
+    source = group["data"]
+    if source.chunks is None:
+        return False
+
+    target = group.create_dataset("data.contiguous", shape=source.shape, dtype=source.dtype)
+    for name, value in source.attrs.items():
+        target.attrs[name] = value
+
+    if source.size:
+        row_bytes = max(1, source.dtype.itemsize * int(np.prod(source.shape[1:])))
+        rows = max(1, block_bytes // row_bytes)
+        for start in range(0, source.shape[0], rows):
+            target[start:start + rows] = source[start:start + rows]
+
+    del group["data"]
+    group.move("data.contiguous", "data")
+    return True
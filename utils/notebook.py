@@ -1,44 +1,158 @@
+from __future__ import print_function, division
+
+from collections import Counter
+
+import numpy as np
+
 __author__ = 'andrey'
 
 
-def print_stats(items):
+def collection_stats(items, details=False):
+    """
+    Collects statistics about a collection of NIX entities (e.g. block.data_arrays) in a single pass.
+
+    :param items:   The entities
+    :param details: Also collect shapes, data types and sizes (for entities with data)
+    :return:        Dict with 'kind', 'count' and 'types' (type -> count), with details also
+                    'shapes' (e.g. '100x20'), 'dtypes' (value -> count) and 'nbytes'
+    """
+    types = Counter()
+    shapes, dtypes = Counter(), Counter()
+    nbytes = 0
+    kind = None
+
+    for item in items:
+        if kind is None:
+            kind = item.__class__.__name__ + "s"
+        types[item.type] += 1
+
+        if details and hasattr(item, 'shape'):
+            shape = tuple(item.shape)
+            dtype = np.dtype(item.dtype)
+            shapes['x'.join(str(n) for n in shape)] += 1
+            dtypes[dtype.name] += 1
+            nbytes += int(np.prod(shape)) * dtype.itemsize
+
+    stats = {'kind': kind, 'count': sum(types.values()), 'types': dict(types)}
+    if details:
+        stats['shapes'] = dict(shapes)
+        stats['dtypes'] = dict(dtypes)
+        stats['nbytes'] = nbytes
+    return stats
+
+
+def print_stats(items, details=False):
     if items is None or len(items) < 1:
         return
 
-    print("\n%-50s (%02d)" % (items[0].__class__.__name__ + "s", len(items)))
-    for t in set(i.type for i in items):
-        print("\ttype: %-35s  (%02d)" % (t, len([1 for i in items if i.type == t])))
+    stats = collection_stats(items, details)
+    print("\n%-50s (%02d)" % (stats['kind'], stats['count']))
+    for t, n in sorted(stats['types'].items(), key=lambda kv: (-kv[1], str(kv[0]))):
+        print("\ttype: %-35s  (%02d)" % (t, n))
+
+    if details:
+        for dtype, n in sorted(stats['dtypes'].items()):
+            print("\tdtype: %-34s  (%02d)" % (dtype, n))
+        print("\ttotal size: %.1f MB" % (stats['nbytes'] / 2.0**20))
+
+
+def metadata_table(section, recursive=True):
+    """
+    Flattens the properties of a section (and of all its subsections) into one table with one
+    row per property value, collected in a single traversal.
+
+    :param section:     The section
+    :param recursive:   Include the properties of all subsections
+    :return:            Structured numpy array with the string fields 'section', 'name', 'value'
+                        and 'unit' (section is the path relative to <section>)
+    """
+    rows = []
+    stack = [('', section)]
+    while stack:
+        path, sec = stack.pop()
+        for prop in sec.props:
+            unit = prop.unit or '-'
+            for v in prop.values:
+                rows.append((path or '.', prop.name, str(getattr(v, 'value', v)), unit))
+        if recursive:
+            children = [(path + '/' + sub.name if path else sub.name, sub) for sub in sec.sections]
+            stack.extend(reversed(children))
 
+    fields = ('section', 'name', 'value', 'unit')
+    widths = [max([len(r[i]) for r in rows] + [1]) for i in range(len(fields))]
+    return np.array(rows, dtype=[(f, 'U%d' % w) for f, w in zip(fields, widths)])
 
-def print_metadata_table(section):
+
+def write_metadata_csv(section, filename, recursive=True):
+    """
+    Writes the flattened properties of a section subtree (see metadata_table) to a CSV file.
+    """
+    import csv
+    table = metadata_table(section, recursive)
+    with open(filename, 'w') as fd:
+        writer = csv.writer(fd)
+        writer.writerow(table.dtype.names)
+        writer.writerows(table.tolist())
+
+
+def metadata_html(section, recursive=True):
+    """
+    Renders the flattened properties of a section subtree (see metadata_table) as an HTML table,
+    e.g. for IPython.display.HTML.
+    """
+    try:
+        from html import escape
+    except ImportError:
+        from cgi import escape
+
+    table = metadata_table(section, recursive)
+    head = ''.join('<th>%s</th>' % n for n in table.dtype.names)
+    body = '\n'.join('<tr>%s</tr>' % ''.join('<td>%s</td>' % escape(c) for c in row) for row in table.tolist())
+    return '<table>\n<tr>%s</tr>\n%s\n</table>' % (head, body)
+
+
+def print_metadata_table(section, page=0, rows_per_page=25, recursive=False):
+    """
+    Plots one page of the properties of a section as a matplotlib table.
+
+    :param section:         The section
+    :param page:            Number of the page to plot (starting with 0)
+    :param rows_per_page:   Maximal number of rows per page, bounds the figure height
+    :param recursive:       Include the properties of all subsections
+    :return:                The figure or None if there is nothing to show
+    """
     import matplotlib.pyplot as plt
-    columns = ['Name', 'Value', 'Unit']
-    cell_text = []
-    for p in [(i.name, i) for i in section.props]:
-        
-        for i, v in enumerate(p[1].values):
-            value = str(v.value)
-            if len(value) > 30:
-                value = value[:30] + '...'
-            if i == 0:
-                row_data = [p[0], value, p[1].unit if p[1].unit else '-']
-            else:
-                row_data = [p[0], value, p[1].unit if p[1].unit else '-']
-
-            cell_text.append(row_data)
-    if len(cell_text) > 0:
-        nrows, ncols = len(cell_text)+1, len(columns)
-        hcell, wcell = 1., 5.
-        hpad, wpad = 0.5, 0    
-        fig = plt.figure(figsize=(ncols*wcell+wpad, nrows*hcell+hpad))
-        ax = fig.add_subplot(111)
-        ax.axis('off')
-        the_table = ax.table(cellText=cell_text,
-                               colLabels=columns, 
-                               loc='center')
-        for cell in the_table.get_children():
-            cell.set_height(.075)
-            cell.set_fontsize(12)
-                        
-    #ax.set_title(section.name, fontsize=12)
+
+    table = metadata_table(section, recursive)
+    pages = int(np.ceil(len(table) / rows_per_page))
+    if len(table) == 0 or page >= pages:
+        return None
+    table = table[page * rows_per_page:(page + 1) * rows_per_page]
+
+    values = table['value']
+    long_values = np.char.str_len(values) > 30
+    values = np.where(long_values, np.char.add(values.astype('U30'), '...'), values)
+
+    if recursive:
+        columns = ['Section', 'Name', 'Value', 'Unit']
+        cell_text = np.column_stack((table['section'], table['name'], values, table['unit'])).tolist()
+    else:
+        columns = ['Name', 'Value', 'Unit']
+        cell_text = np.column_stack((table['name'], values, table['unit'])).tolist()
+
+    nrows, ncols = len(cell_text)+1, len(columns)
+    hcell, wcell = 0.4, 5.
+    hpad, wpad = 0.5, 0
+    fig = plt.figure(figsize=(ncols*wcell+wpad, nrows*hcell+hpad))
+    ax = fig.add_subplot(111)
+    ax.axis('off')
+    the_table = ax.table(cellText=cell_text,
+                         colLabels=columns,
+                         loc='center')
+    for cell in the_table.get_children():
+        cell.set_height(1. / nrows)
+        cell.set_fontsize(12)
+
+    if pages > 1:
+        ax.set_title('%s (page %d of %d)' % (section.name, page + 1, pages), fontsize=12)
     return fig
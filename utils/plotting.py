@@ -3,11 +3,12 @@
 from __future__ import print_function, division
 
 import numpy as np
-import scipy.signal as sp
-import random
-
 import nixio as nix
-import matplotlib.pyplot as plt
+
+from .memmap import data_view
+
+# matplotlib and scipy are imported by the functions using them, so that importing this module
+# (e.g. to check plottable arrays in a batch job) stays cheap
 
 COLORS_BLUE_AND_RED = (
     'dodgerblue', 'red'
@@ -82,7 +83,7 @@ class Plotter(object):
         """
         self.last_figure.savefig(name)
 
-    def add(self, array, subplot=0, color=None, xlim=None, downsample=None, labels=None):
+    def add(self, array, subplot=0, color=None, xlim=None, downsample=None, labels=None, ylim=None):
         """
         Add a new data array to the plot
 
@@ -92,9 +93,10 @@ class Plotter(object):
         :param xlim:        Start and end of the x-axis limits.
         :param downsample:  True if the array should be sampled down
         :param labels:      Data array with labels that should be added to each data point of the array to plot
+        :param ylim:        Start and end of the y-axis limits (image-like arrays only).
         """
         color = self.__mk_color(color, subplot)
-        pdata = PlottingData(array, color, subplot, xlim, downsample, labels)
+        pdata = PlottingData(array, color, subplot, xlim, downsample, labels, ylim)
         self.subplot_data[subplot].append(pdata)
 
     def plot(self, width=None, height=None, dpi=None, lines=None, cols=None, facecolor=None):
@@ -145,12 +147,14 @@ class Plotter(object):
                         plot_array_2d_set(pdata.array, axis, color=pdata.color, xlim=pdata.xlim,
                                           downsample=pdata.downsample)
                     else:
-                        plot_array_2d(pdata.array, axis, color=pdata.color, xlim=pdata.xlim,
+                        plot_array_2d(pdata.array, axis, color=pdata.color, xlim=pdata.xlim, ylim=pdata.ylim,
                                       downsample=pdata.downsample)
                 else:
                     raise Exception('Unsupported data')
 
-            axis.legend()
+            # plot_array_2d_set adds its own per-row legend
+            if axis.get_legend() is None:
+                axis.legend()
 
         self.__last_figure = figure
 
@@ -166,6 +170,7 @@ class Plotter(object):
             color = self.defaultcolors[count if count < color_count else color_count - 1]
 
         if color == "random":
+            import random
             color = "#%02x%02x%02x" % (random.randint(50, 255), random.randint(50, 255), random.randint(50, 255))
 
         return color
@@ -216,7 +221,7 @@ class Plotter(object):
 
 class PlottingData(object):
 
-    def __init__(self, array, color, subplot=0, xlim=None, downsample=False, labels=None):
+    def __init__(self, array, color, subplot=0, xlim=None, downsample=False, labels=None, ylim=None):
         self.array = array
         self.dimensions = array.dimensions
         self.shape = array.shape
@@ -224,18 +229,47 @@ class PlottingData(object):
         self.color = color
         self.subplot = subplot
         self.xlim = xlim
+        self.ylim = ylim
         self.downsample = downsample
         self.labels = labels
 
     def __cmp__(self, other):
         weights = lambda dims: [(1 if d.dimension_type == nix.DimensionType.Sample else 0) for d in dims]
-        return cmp(weights(self.array.dimensions), weights(other.array.dimensions))
+        w_self, w_other = weights(self.array.dimensions), weights(other.array.dimensions)
+        return (w_self > w_other) - (w_self < w_other)
 
     def __lt__(self, other):
         return self.__cmp__(other) < 0
 
 
+def plottable(array):
+    """
+    Checks if a data array has a shape and dimension layout that Plotter.plot can render.
+
+    :param array:   The data array to check
+    :return:        True if the array is supported
+    """
+    sig_types = (nix.DimensionType.Range, nix.DimensionType.Sample)
+    dims = array.dimensions
+    nd = len(array.shape)
+
+    if nd != len(dims) or nd not in (1, 2):
+        return False
+
+    d1type = dims[0].dimension_type
+    if nd == 1:
+        return d1type == nix.DimensionType.Set or d1type in sig_types
+
+    d2type = dims[1].dimension_type
+    if d1type == nix.DimensionType.Set:
+        return d2type == nix.DimensionType.Sample
+
+    return d1type == nix.DimensionType.Sample and d2type == nix.DimensionType.Sample
+
+
 def plot_make_figure(width, height, dpi, cols, lines, facecolor):
+    import matplotlib.pyplot as plt
+
     axis_all = []
     figure = plt.figure(facecolor=facecolor, figsize=(width / dpi, height / dpi), dpi=90)
     figure.subplots_adjust(wspace=0.3, hspace=0.3, left=0.1, right=0.9, bottom=0.05, top=0.95)
@@ -259,7 +293,7 @@ def plot_array_1d(array, axis, color=None, xlim=None, downsample=None, hint=None
 
     assert dim.dimension_type in (nix.DimensionType.Sample, nix.DimensionType.Range), "Unsupported data"
 
-    y = array[:]
+    y = data_view(array)[:]
     if dim.dimension_type == nix.DimensionType.Sample:
         x_start = dim.offset or 0
         x = np.arange(0, array.shape[0]) * dim.sampling_interval + x_start
@@ -267,6 +301,7 @@ def plot_array_1d(array, axis, color=None, xlim=None, downsample=None, hint=None
         x = np.array(dim.ticks)
     
     if downsample is not None:
+        import scipy.signal as sp
         x = sp.decimate(x, downsample)
         y = sp.decimate(y, downsample)
     if xlim is not None:
@@ -284,32 +319,162 @@ def plot_array_1d_set(array, axis, color=None, xlim=None, hint=None, labels=None
 
     assert dim.dimension_type == nix.DimensionType.Set, "Unsupported data"
 
-    x = array[:]
-    z = np.ones_like(x) * 0.8 * (hint or 0.5) + 0.1
+    row = 0.8 * (hint or 0.5) + 0.1
     if second_y:
+        # the events share the x axis of the signals already plotted into <axis>
+        if xlim is None:
+            xlim = axis.get_xlim()
         ax2 = axis.twinx()
         ax2.set_ylim([0, 1])
-        ax2.scatter(x, z, 50, color, linewidths=2, label=array.name, marker="|")
         ax2.set_yticks([])
-
-        if labels is not None:
-            for i, v in enumerate(labels[:]):
-                ax2.annotate(str(v), (x[i], z[i]))
+        plot_events([array], ax2, rows=[row], colors=[color], xlim=xlim, labels=[labels], height=0.1)
+        axis.set_xlim(xlim)
 
     else:
-        #x = array[xlim or Ellipsis]
         axis.set_ylim([0, 1])
-        axis.scatter(x, z, 50, color, linewidths=2, label=array.name, marker="|")
+        plot_events([array], axis, rows=[row], colors=[color], xlim=xlim, labels=[labels], height=0.1)
         axis.set_xlabel('%s [%s]' % (array.label, array.unit))
         axis.set_ylabel(array.name)
         axis.set_yticks([])
 
-        if labels is not None:
-            for i, v in enumerate(labels[:]):
-                axis.annotate(str(v), (x[i], z[i]))
+
+def plot_raster(arrays, axis, colors=None, xlim=None, labels=None, height=0.8, max_labels=None):
+    """
+    Plots event arrays (e.g. spike times of many cells or trials) as rows of a raster plot.
+
+    :param arrays:      Sequence of 1-D event arrays (data arrays with a set dimension or numpy arrays)
+    :param axis:        The axis to plot into
+    :param colors:      One color for all rows or a sequence with one color per row
+    :param xlim:        Only events inside these limits are read and drawn
+    :param labels:      Optional sequence with one label array (or None) per row
+    :param height:      Height of an event tick in rows
+    :param max_labels:  Maximal number of labels per row (default derived from the axis width)
+    """
+    rows = np.arange(len(arrays))
+    plot_events(arrays, axis, rows=rows, colors=colors, xlim=xlim, labels=labels, height=height,
+                max_labels=max_labels)
+
+    axis.set_ylim([-0.5, len(arrays) - 0.5])
+    axis.set_yticks(rows)
+    axis.set_yticklabels([getattr(a, 'name', str(i)) for i, a in enumerate(arrays)])
+    if len(arrays) > 0 and hasattr(arrays[0], 'unit'):
+        axis.set_xlabel('%s [%s]' % (arrays[0].label, arrays[0].unit))
+
+
+def plot_events(arrays, axis, rows, colors=None, xlim=None, labels=None, height=0.8, max_labels=None):
+    """
+    Draws the events of several arrays as vertical ticks, using a single path per array.
+
+    :param arrays:      Sequence of sorted 1-D event arrays
+    :param axis:        The axis to plot into
+    :param rows:        The y position of each array
+    :param colors:      One color for all rows or a sequence with one color per row
+    :param xlim:        Only events inside these limits are read and drawn
+    :param labels:      Optional sequence with one label array (or None) per row
+    :param height:      Height of the ticks in data units
+    :param max_labels:  Maximal number of labels per row (default derived from the axis width)
+    """
+    if colors is None or isinstance(colors, str):
+        colors = [colors or 'k'] * len(arrays)
+
+    events, ranges = [], []
+    for array in arrays:
+        data = data_view(array)
+        start, stop = event_range(data, xlim)
+        events.append(np.asarray(data[start:stop], dtype=np.float64))
+        ranges.append((start, stop))
+
+    if xlim is not None:
+        x_min, x_max = xlim
+    else:
+        non_empty = [e for e in events if len(e)]
+        x_min = min(e[0] for e in non_empty) if non_empty else 0.0
+        x_max = max(e[-1] for e in non_empty) if non_empty else 1.0
+        if x_max <= x_min:
+            x_min, x_max = x_min - 0.5, x_max + 0.5
+
+    # events falling onto the same pixel column are drawn once
+    pixels = max(1, int(axis.get_window_extent().width)) * 2
+    scale = pixels / (x_max - x_min)
+
+    for array, row, color, x in zip(arrays, rows, colors, events):
+        if len(x) > pixels:
+            column = ((x - x_min) * scale).astype(np.int64)
+            x = x[np.flatnonzero(np.diff(column, prepend=column[0] - 1))]
+
+        # one path per row, ticks are separated by NaN
+        xs = np.repeat(x, 3)
+        ys = np.tile([row - height / 2.0, row + height / 2.0, np.nan], len(x))
+        xs[2::3] = np.nan
+        axis.plot(xs, ys, color=color, label=getattr(array, 'name', None))
+
+    axis.set_xlim([x_min, x_max])
+
+    if labels is None:
+        return
+
+    bbox = axis.get_window_extent()
+    if max_labels is None:
+        max_labels = max(1, int(bbox.width // 40))
+    # label only as many rows as fit above each other
+    row_step = int(np.ceil(len(arrays) / max(1, bbox.height // 15)))
+
+    for i, (row, x, label_array, (start, stop)) in enumerate(zip(rows, events, labels, ranges)):
+        if label_array is None or len(x) == 0 or i % row_step:
+            continue
+
+        # keep the first event per label slot, so labels never pile up in dense regions
+        slots = ((x - x_min) / ((x_max - x_min) or 1.0) * max_labels).astype(int)
+        _, keep = np.unique(slots, return_index=True)
+
+        values = np.asarray(data_view(label_array)[start:stop])
+        for j in keep:
+            axis.annotate(str(values[j]), (x[j], row + height / 2.0))
+
+
+def event_range(array, xlim=None, block=4096):
+    """
+    Finds the index range of the events inside <xlim>. The events have to be sorted.
+
+    Small arrays are read at once, larger arrays are bisected on disk, so that only a few
+    elements and the final range have to be read.
+
+    :param array:   Sorted 1-D event array
+    :param xlim:    Start and end of the range or None for all events
+    :param block:   Arrays (or remaining search intervals) up to this size are read at once
+    :return:        Tuple (start, stop)
+    """
+    n = array.shape[0]
+    if xlim is None:
+        return 0, n
+
+    return _bisect_events(array, xlim[0], 'left', n, block), _bisect_events(array, xlim[1], 'right', n, block)
+
+
+def _bisect_events(array, value, side, n, block):
+    lo, hi = 0, n
+    while hi - lo > block:
+        mid = (lo + hi) // 2
+        v = array[mid:mid + 1][0]
+        if v < value or (side == 'right' and v == value):
+            lo = mid + 1
+        else:
+            hi = mid
+
+    return lo + int(np.searchsorted(np.asarray(array[lo:hi]), value, side=side))
 
 
-def plot_array_2d(array, axis, color=None, xlim=None, downsample=None, hint=None, labels=None):
+def plot_array_2d(array, axis, color=None, xlim=None, downsample=None, hint=None, labels=None, ylim=None,
+                  method="mean"):
+    """
+    Plots an image-like array (Sample x Sample). The data is read tile by tile and reduced to
+    the pixel size of the target axis, so only a bounded part of the array is held in memory.
+
+    :param xlim:        Region of interest along the first dimension (in dimension units)
+    :param ylim:        Region of interest along the second dimension (in dimension units)
+    :param downsample:  Minimal decimation factor, applied on top of the pixel based reduction
+    :param method:      "mean" for block averages or "stride" to pick every n-th sample
+    """
     d1 = array.dimensions[0]
     d2 = array.dimensions[1]
 
@@ -319,21 +484,165 @@ def plot_array_2d(array, axis, color=None, xlim=None, downsample=None, hint=None
     assert d1_type == nix.DimensionType.Sample, "Unsupported data"
     assert d2_type == nix.DimensionType.Sample, "Unsupported data"
 
-    z = array[:]
-    x_start = d1.offset or 0
-    y_start = d2.offset or 0
-    x_end = x_start + array.shape[0] * d1.sampling_interval
-    y_end = y_start + array.shape[1] * d2.sampling_interval
+    rows = sampled_index_range(d1, array.shape[0], xlim)
+    cols = sampled_index_range(d2, array.shape[1], ylim)
+
+    bbox = axis.get_window_extent()
+    target = [max(1, int(bbox.width)), max(1, int(bbox.height))]
+    if downsample is not None:
+        target[0] = min(target[0], max(1, (rows[1] - rows[0]) // downsample))
+        target[1] = min(target[1], max(1, (cols[1] - cols[0]) // downsample))
+
+    z, _ = read_image_2d(array, rows, cols, target, method)
+
+    x_start = (d1.offset or 0) + rows[0] * d1.sampling_interval
+    y_start = (d2.offset or 0) + cols[0] * d2.sampling_interval
+    x_end = (d1.offset or 0) + rows[1] * d1.sampling_interval
+    y_end = (d2.offset or 0) + cols[1] * d2.sampling_interval
 
-    axis.imshow(z, origin='lower', extent=[x_start, x_end, y_start, y_end])
+    # first dimension runs along the x-axis, hence the transpose
+    img = axis.imshow(z.T, origin='lower', extent=[x_start, x_end, y_start, y_end], interpolation='nearest')
     axis.set_xlabel('%s [%s]' % (d1.label, d1.unit))
     axis.set_ylabel('%s [%s]' % (d2.label, d2.unit))
     axis.set_title(array.name)
-    bar = plt.colorbar()
-    bar.label('%s [%s]' % (array.label, array.unit))
+    bar = axis.figure.colorbar(img, ax=axis)
+    bar.set_label('%s [%s]' % (array.label, array.unit))
+
+
+def sampled_index_range(dim, size, lim=None):
+    """
+    Converts limits in units of a sampled dimension to a (start, stop) index range.
+
+    :param dim:     The sampled dimension
+    :param size:    Number of samples along the dimension
+    :param lim:     Start and end in dimension units or None for the whole dimension
+    :return:        Tuple (start, stop) with at least one sample
+    """
+    if lim is None:
+        return 0, size
+
+    start = dim.offset or 0
+    i0 = int(np.floor((lim[0] - start) / dim.sampling_interval))
+    i1 = int(np.ceil((lim[1] - start) / dim.sampling_interval))
+    i0 = min(max(i0, 0), size - 1)
+    i1 = min(max(i1, i0 + 1), size)
+    return i0, i1
+
+
+def block_mean(data, step, axis):
+    """
+    Averages consecutive blocks of <step> samples along <axis>; a trailing partial block is
+    averaged over the samples it has.
+    """
+    n = data.shape[axis]
+    starts = np.arange(0, n, step)
+    counts = np.diff(np.append(starts, n)).astype(np.float64)
+    sums = np.add.reduceat(data, starts, axis=axis, dtype=np.float64)
+    shape = [1] * data.ndim
+    shape[axis] = len(counts)
+    return sums / counts.reshape(shape)
+
+
+def min_max_decimate(data, bucket):
+    """
+    Reduces every block of <bucket> samples along the last axis to its min and max. Both values
+    are kept in the order in which they occur, so that smooth traces keep their shape.
+
+    :param data:    2-D array (rows, samples)
+    :param bucket:  Number of samples per block
+    :return:        Array (rows, 2 * number of blocks)
+    """
+    rows, n = data.shape
+    nb = (n + bucket - 1) // bucket
+    if nb * bucket != n:
+        data = np.pad(data, ((0, 0), (0, nb * bucket - n)), mode='edge')
+
+    blocks = data.reshape(rows, nb, bucket)
+    i_min = blocks.argmin(axis=2)
+    i_max = blocks.argmax(axis=2)
+    v_min = np.take_along_axis(blocks, i_min[:, :, np.newaxis], axis=2)[:, :, 0]
+    v_max = np.take_along_axis(blocks, i_max[:, :, np.newaxis], axis=2)[:, :, 0]
+
+    min_first = i_min <= i_max
+    out = np.empty((rows, 2 * nb), dtype=data.dtype)
+    out[:, 0::2] = np.where(min_first, v_min, v_max)
+    out[:, 1::2] = np.where(min_first, v_max, v_min)
+    return out
+
 
+def read_image_2d(array, rows=None, cols=None, target=None, method="mean", tile_size=2**22):
+    """
+    Reads a decimated copy of a region of a 2-D array without loading the whole region.
+
+    The region is processed in tiles of at most about <tile_size> elements read (whole output rows
+    if they fit, otherwise blocks of rows and columns). With method "mean" each tile is read
+    contiguously and reduced by block averaging, with "stride" only every n-th row and column is read.
+
+    :param array:       The 2-D data array
+    :param rows:        Index range (start, stop) along the first dimension
+    :param cols:        Index range (start, stop) along the second dimension
+    :param target:      Maximal output size (rows, cols), e.g. the pixel size of an axis
+    :param method:      "mean" or "stride"
+    :param tile_size:   Approximate number of elements read at once
+    :return:            Tuple (data, (row_step, col_step))
+    """
+    assert method in ("mean", "stride"), "Unknown method %s" % method
+
+    data = data_view(array)
+    r0, r1 = rows or (0, array.shape[0])
+    c0, c1 = cols or (0, array.shape[1])
+    n_rows, n_cols = r1 - r0, c1 - c0
+    t_rows, t_cols = target or (n_rows, n_cols)
+
+    r_step = max(1, int(np.ceil(n_rows / max(t_rows, 1))))
+    c_step = max(1, int(np.ceil(n_cols / max(t_cols, 1))))
+    out_rows = (n_rows + r_step - 1) // r_step
+    out_cols = (n_cols + c_step - 1) // c_step
+
+    # elements read per output element, the tile is sized in output elements
+    strided = method == "stride"
+    per_output = 1 if strided else r_step * c_step
+    tile_cols = max(1, min(out_cols, tile_size // per_output))
+    tile_rows = max(1, tile_size // (per_output * tile_cols))
+
+    parts = []
+    for o0 in range(0, out_rows, tile_rows):
+        o1 = min(out_rows, o0 + tile_rows)
+        start, stop = r0 + o0 * r_step, min(r1, r0 + o1 * r_step)
+
+        row = []
+        for p0 in range(0, out_cols, tile_cols):
+            p1 = min(out_cols, p0 + tile_cols)
+            left, right = c0 + p0 * c_step, min(c1, c0 + p1 * c_step)
+
+            if strided:
+                tile = np.asarray(data[start:stop:r_step, left:right:c_step])
+            else:
+                tile = np.asarray(data[start:stop, left:right])
+                if r_step > 1:
+                    tile = block_mean(tile, r_step, 0)
+                if c_step > 1:
+                    tile = block_mean(tile, c_step, 1)
+            row.append(tile)
+
+        parts.append(np.concatenate(row, axis=1) if len(row) > 1 else row[0])
+
+    return np.concatenate(parts, axis=0), (r_step, c_step)
+
+
+def plot_array_2d_set(array, axis, color=None, xlim=None, downsample=None, hint=None, labels=None, rows=None,
+                      summary=None, chunk_size=2**22):
+    """
+    Plots a Set x Sample array (e.g. trials) as a single LineCollection that shares one time axis.
 
-def plot_array_2d_set(array, axis, color=None, xlim=None, downsample=None, hint=None, labels=None):
+    Only the samples inside <xlim> are read, in chunks of rows. If there are more samples than
+    horizontal pixels (or <downsample> is given), each block of samples is drawn by its min and max.
+
+    :param rows:        Tuple (start, stop) of the rows to plot (default all rows)
+    :param downsample:  Number of samples per min/max block (default derived from the axis width)
+    :param summary:     None to draw every row, "std" or "sem" to draw the mean +- spread instead
+    :param chunk_size:  Approximate number of elements read at once
+    """
     d1 = array.dimensions[0]
     d2 = array.dimensions[1]
 
@@ -342,16 +651,73 @@ def plot_array_2d_set(array, axis, color=None, xlim=None, downsample=None, hint=
 
     assert d1_type == nix.DimensionType.Set, "Unsupported data"
     assert d2_type == nix.DimensionType.Sample, "Unsupported data"
+    assert summary in (None, "std", "sem"), "Unknown summary %s" % summary
 
+    r0, r1 = rows or (0, array.shape[0])
+    c0, c1 = sampled_index_range(d2, array.shape[1], xlim)
+    n = c1 - c0
+
+    # two points (min and max) per bucket, about one point per pixel
+    bucket = downsample or max(1, 2 * n // max(1, int(axis.get_window_extent().width)))
+    starts = np.arange(0, n, bucket)
     x_start = d2.offset or 0
-    x_one = x_start + np.arange(0, array.shape[1]) * d2.sampling_interval
-    x = np.tile(x_one.reshape(array.shape[1], 1), array.shape[0])
-    y = array[:]
-    axis.plot(x, y.T, color=color)
+    x_buckets = x_start + (c0 + starts) * d2.sampling_interval
+
+    source = data_view(array)
+    rows_per_chunk = max(1, chunk_size // max(n, 1))
+    if summary is None:
+        x = np.repeat(x_buckets, 2) if bucket > 1 else x_buckets
+        segments = np.empty((r1 - r0, len(x), 2))
+        segments[:, :, 0] = x
+    else:
+        s1 = np.zeros(n)
+        s2 = np.zeros(n)
+
+    for r in range(r0, r1, rows_per_chunk):
+        data = np.asarray(source[r:min(r1, r + rows_per_chunk), c0:c1], dtype=np.float64)
+
+        if summary is not None:
+            s1 += data.sum(axis=0)
+            s2 += np.square(data).sum(axis=0)
+        elif bucket > 1:
+            segments[r - r0:r - r0 + len(data), :, 1] = min_max_decimate(data, bucket)
+        else:
+            segments[r - r0:r - r0 + len(data), :, 1] = data
+
+    if summary is None:
+        import matplotlib
+        from matplotlib.collections import LineCollection
+        from matplotlib.lines import Line2D
+
+        colors = color
+        if d1.labels and 1 < len(segments) <= 10:
+            cycle = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+            colors = [cycle[i % len(cycle)] for i in range(len(segments))]
+
+        lines = LineCollection(segments, colors=colors, label=array.name)
+        axis.add_collection(lines)
+        axis.autoscale_view()
+
+        if d1.labels and not isinstance(colors, str) and colors is not None:
+            handles = [Line2D([], [], color=c, label=l) for c, l in zip(colors, d1.labels[r0:r1])]
+            axis.legend(handles=handles)
+    else:
+        m = r1 - r0
+        mean = s1 / m
+        spread = np.sqrt(np.maximum(s2 / m - mean ** 2, 0) * m / max(m - 1, 1))
+        if summary == "sem":
+            spread /= np.sqrt(m)
+
+        x = x_buckets
+        if bucket > 1:
+            mean = block_mean(mean, bucket, 0)
+            spread = block_mean(spread, bucket, 0)
+            x = x + (np.diff(np.append(starts, n)) - 1) / 2.0 * d2.sampling_interval
+
+        axis.fill_between(x, mean - spread, mean + spread, color=color, alpha=0.3, linewidth=0)
+        axis.plot(x, mean, color=color, label='%s (mean +- %s, n=%d)' % (array.name, summary, m))
+
+    axis.set_xlim([x_buckets[0], x_start + (c1 - 1) * d2.sampling_interval])
     axis.set_title(array.name)
     axis.set_xlabel('%s [%s]' % (d2.label, d2.unit))
     axis.set_ylabel('%s [%s]' % (array.label, array.unit))
-
-    if d1.labels is not None:
-        axis.legend(d1.labels)
-
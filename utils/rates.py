@@ -0,0 +1,220 @@
+# !/usr/bin/env python
+#  -*- coding: utf-8 -*-
+"""
+Firing rates and PSTHs of spike trains stored as data arrays of spike times with a set dimension
+(e.g. 'cell 0001 spikes' of gen-demo-data.py or RGC_i_stim_N of scripts/convert_ret1.py).
+
+All trains are binned with a single bincount over a (train, bin) index and smoothed together by
+FFT convolution in batches of rows, so rate maps of thousands of cells take a few numpy calls.
+The results are (trains, bins) arrays that write_rates stores as Set x Sample data arrays.
+
+    rates, time = kernel_rate(spike_arrays, 0.001, sigma=0.01, stop=10.0)
+    counts, time = tag_psth(block.multi_tags['stimulus'], spike_arrays, 0.005, pre=0.1)
+    write_rates(block, 'firing rate', rates, 0.001, time[0], labels=[a.name for a in spike_arrays])
+"""
+from __future__ import print_function, division
+
+import numpy as np
+
+from .epochs import tag_positions
+
+KERNELS = ('gauss', 'box', 'exp')
+
+
+def spike_times(train):
+    """
+    Returns the spike times of a data array (or any sequence) as float64 array.
+    """
+    return np.asarray(train[:], dtype=np.float64).ravel()
+
+
+def bin_counts(times, ids, n_trains, interval, start, stop):
+    """
+    Counts events given as (time, train id) pairs in bins of <interval> between start and stop.
+
+    :return:    Counts array of shape (n_trains, bins)
+    """
+    bins = int(np.ceil((stop - start) / interval - 1e-9))
+    index = np.floor((times - start) / interval).astype(np.int64)
+    valid = (index >= 0) & (index < bins)
+    flat = ids[valid] * bins + index[valid]
+    return np.bincount(flat, minlength=n_trains * bins).reshape(n_trains, bins).astype(np.float64)
+
+
+def spike_counts(trains, interval, start=0.0, stop=None):
+    """
+    Bins several spike trains at once.
+
+    :param trains:      Sequence of data arrays (or arrays) with spike times
+    :param interval:    Bin width, in the unit of the spike times
+    :param start:       Start of the first bin
+    :param stop:        End of the last bin (default: the last spike)
+    :return:            Tuple (counts, time): counts has the shape (trains, bins), time holds the
+                        start of each bin
+    """
+    times = [spike_times(t) for t in trains]
+    if stop is None:
+        stop = max([t.max() for t in times if len(t)] or [start]) + interval
+    ids = np.repeat(np.arange(len(times)), [len(t) for t in times])
+    all_times = np.concatenate(times) if times else np.empty(0)
+
+    counts = bin_counts(all_times, ids, len(times), interval, start, stop)
+    return counts, start + np.arange(counts.shape[1]) * interval
+
+
+def binned_rate(trains, interval, start=0.0, stop=None):
+    """
+    Firing rates as spike counts per bin divided by the bin width. See spike_counts.
+    """
+    counts, time = spike_counts(trains, interval, start, stop)
+    return counts / interval, time
+
+
+def make_kernel(kernel, sigma, interval):
+    """
+    Returns a discrete kernel normalized to a sum of one and the index of its origin.
+
+    :param kernel:      'gauss' (standard deviation <sigma>), 'box' (width <sigma>) or 'exp' (causal,
+                        time constant <sigma>)
+    :param sigma:       Width of the kernel, in the unit of the spike times
+    :param interval:    Bin width
+    """
+    if kernel == 'gauss':
+        half = int(np.ceil(4 * sigma / interval))
+        x = np.arange(-half, half + 1) * interval
+        k = np.exp(-0.5 * (x / sigma) ** 2)
+        origin = half
+    elif kernel == 'box':
+        half = max(0, int(round(sigma / interval / 2)))
+        k = np.ones(2 * half + 1)
+        origin = half
+    elif kernel == 'exp':
+        x = np.arange(int(np.ceil(5 * sigma / interval)) + 1) * interval
+        k = np.exp(-x / sigma)
+        origin = 0
+    else:
+        raise ValueError('Unknown kernel %s, use one of %s' % (kernel, ', '.join(KERNELS)))
+    return k / k.sum(), origin
+
+
+def convolve_rows(data, k, origin, batch=1024):
+    """
+    Convolves every row of <data> with the kernel <k> by FFT. The result has the shape of <data>,
+    entry i is centered on the kernel's origin at bin i.
+
+    :param batch:   Number of rows transformed at once (bounds the memory)
+    """
+    n = data.shape[1]
+    nfft = 1 << max(0, int(n + len(k) - 2).bit_length())
+    fk = np.fft.rfft(k, nfft)
+
+    out = np.empty(data.shape, dtype=np.float64)
+    for a in range(0, data.shape[0], batch):
+        b = min(data.shape[0], a + batch)
+        full = np.fft.irfft(np.fft.rfft(data[a:b], nfft, axis=1) * fk, nfft, axis=1)
+        out[a:b] = full[:, origin:origin + n]
+    return out
+
+
+def kernel_rate(trains, interval, sigma, start=0.0, stop=None, kernel='gauss', batch=1024):
+    """
+    Kernel-smoothed firing rates of several spike trains.
+
+    :param trains:      Sequence of data arrays (or arrays) with spike times
+    :param interval:    Sampling interval of the rates
+    :param sigma:       Width of the kernel, see make_kernel
+    :param start:       Start of the first bin
+    :param stop:        End of the last bin (default: the last spike)
+    :param kernel:      'gauss', 'box' or 'exp'
+    :param batch:       Number of trains convolved at once
+    :return:            Tuple (rates, time) like binned_rate
+    """
+    counts, time = spike_counts(trains, interval, start, stop)
+    k, origin = make_kernel(kernel, sigma, interval)
+    return convolve_rows(counts, k, origin, batch) / interval, time
+
+
+def aligned_times(times, positions, pre, post):
+    """
+    Returns the event times relative to every position with position - pre <= time < position + post,
+    the index of that position and the index of the event in <times>. The positions must be sorted,
+    an event inside several overlapping windows is returned once per window.
+    """
+    first = np.searchsorted(positions + post, times, side='right')
+    last = np.searchsorted(positions - pre, times, side='right')
+    n = np.maximum(last - first, 0)
+    index = np.repeat(np.arange(len(times)), n)
+    offset = np.cumsum(n) - n
+    trial = np.arange(n.sum()) - np.repeat(offset - first, n)
+    return times[index] - positions[trial], trial, index
+
+
+def psth(trains, positions, interval, pre=0.0, post=None, sigma=None, kernel='gauss', batch=1024):
+    """
+    Trial-aligned peri-stimulus time histograms of several spike trains.
+
+    :param trains:      Sequence of data arrays (or arrays) with spike times
+    :param positions:   Onset of each trial
+    :param interval:    Bin width
+    :param pre:         Time before the onsets
+    :param post:        Time after the onsets (default: the shortest time between two onsets)
+    :param sigma:       Smooth the histograms with a kernel of this width (see make_kernel)
+    :param kernel:      'gauss', 'box' or 'exp'
+    :param batch:       Number of trains convolved at once
+    :return:            Tuple (rates, time): rates are spikes per trial and time unit with the shape
+                        (trains, bins), time is the start of each bin relative to the onsets
+    """
+    positions = np.sort(np.asarray(positions, dtype=np.float64))
+    if post is None:
+        post = np.diff(positions).min() if len(positions) > 1 else interval
+
+    times = [spike_times(t) for t in trains]
+    ids = np.repeat(np.arange(len(times)), [len(t) for t in times])
+    all_times = np.concatenate(times) if times else np.empty(0)
+
+    rel, _, index = aligned_times(all_times, positions, pre, post)
+    counts = bin_counts(rel, ids[index], len(times), interval, -pre, post)
+    if sigma is not None:
+        k, origin = make_kernel(kernel, sigma, interval)
+        counts = convolve_rows(counts, k, origin, batch)
+
+    rates = counts / (max(1, len(positions)) * interval)
+    return rates, -pre + np.arange(counts.shape[1]) * interval
+
+
+def tag_psth(tag, trains, interval, pre=0.0, post=None, sigma=None, kernel='gauss', batch=1024):
+    """
+    PSTHs aligned to the positions of a Tag or MultiTag. Without <post> the longest extent of the
+    tag is used (or the shortest time between two positions if it has none). See psth.
+    """
+    positions, extents = tag_positions(tag)
+    if post is None and extents is not None and len(extents):
+        post = extents.max()
+    return psth(trains, positions, interval, pre, post, sigma, kernel, batch)
+
+
+def write_rates(block, name, rates, interval, offset=0.0, labels=None, type_='nix.data.sampled.spike_rate',
+                unit='Hz', time_unit='s'):
+    """
+    Stores a (trains, bins) rate array as data array with a set and a sampled dimension.
+
+    :param block:       The block to create the array in
+    :param name:        Name of the data array
+    :param rates:       Rates as returned by binned_rate, kernel_rate or psth
+    :param interval:    Bin width
+    :param offset:      Time of the first bin (e.g. time[0])
+    :param labels:      Labels of the rows (e.g. the names of the spike arrays)
+    :return:            The data array
+    """
+    array = block.create_data_array(name, type_, data=np.asarray(rates, dtype=np.float64))
+    array.unit = unit
+    array.label = 'spike rate'
+
+    dim = array.append_set_dimension()
+    if labels is not None:
+        dim.labels = [str(l) for l in labels]
+    dim = array.append_sampled_dimension(interval)
+    dim.offset = offset
+    dim.unit = time_unit
+    dim.label = 'time'
+    return array
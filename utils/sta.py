@@ -0,0 +1,99 @@
+# !/usr/bin/env python
+#  -*- coding: utf-8 -*-
+"""
+Spike-triggered averages of a white noise stimulus as stored by scripts/convert_ret1.py
+(stimulus_N_data: pixels x frames, RGC_i_stim_N: spike times in seconds).
+
+The stimulus is read once in chunks of frames. Within a chunk the spikes of all cells are turned into
+per-frame spike counts and every lag is a single matrix product, so neither the stimulus nor a
+spikes x window x pixels array is ever held in memory.
+
+    stas, counts, names = block_sta(nix_file.blocks[0], 0, window=3)
+"""
+from __future__ import print_function, division
+
+import re
+import threading
+
+import numpy as np
+
+
+def spike_frames(spike_times, interval, offset=0.0):
+    """
+    Returns the index of the stimulus frame each spike falls into.
+    """
+    return np.floor((np.asarray(spike_times, dtype=np.float64) - offset) / interval).astype(np.int64)
+
+
+def sta(stimulus, spike_trains, interval=None, window=3, chunk=4096, workers=1, offset=0.0):
+    """
+    Computes the spike-triggered averages of several cells in one pass over the stimulus.
+
+    :param stimulus:        Stimulus (pixels x frames) as data array, numpy array or memmap
+    :param spike_trains:    Sequence with the spike times of each cell
+    :param interval:        Frame interval (default: sampling interval of the stimulus' second dimension)
+    :param window:          Number of frames before (and including) the spike frame
+    :param chunk:           Number of frames read at once
+    :param workers:         Number of threads the cells are split across
+    :param offset:          Time of the first stimulus frame
+    :return:                Tuple (stas, counts): stas has the shape (cells, window, pixels) with
+                            lag 0 (the frame of the spike) first, counts the number of spikes used
+    """
+    if interval is None:
+        interval = stimulus.dimensions[1].sampling_interval
+
+    n_pixels, n_frames = stimulus.shape
+    n_cells = len(spike_trains)
+
+    # only spikes with a complete window inside the stimulus are used
+    frames = []
+    for train in spike_trains:
+        f = np.sort(spike_frames(train[:], interval, offset))
+        frames.append(f[(f >= window - 1) & (f < n_frames)])
+    counts = np.array([len(f) for f in frames])
+
+    sums = np.zeros((n_cells, window, n_pixels))
+    groups = [g for g in np.array_split(np.arange(n_cells), max(1, min(workers, n_cells))) if len(g)]
+
+    for a in range(window - 1, n_frames, chunk):
+        b = min(n_frames, a + chunk)
+        # frames a - window + 1 ... b - 1, so that every lag of the spikes in [a, b) is available
+        stim = np.asarray(stimulus[:, a - window + 1:b], dtype=np.float64)
+
+        hist = np.zeros((b - a, n_cells))
+        for c, f in enumerate(frames):
+            lo, hi = np.searchsorted(f, [a, b])
+            if hi > lo:
+                hist[:, c] = np.bincount(f[lo:hi] - a, minlength=b - a)
+
+        def accumulate(cells):
+            for k in range(window):
+                sums[cells, k] += stim[:, window - 1 - k:window - 1 - k + b - a].dot(hist[:, cells]).T
+
+        if len(groups) > 1:
+            threads = [threading.Thread(target=accumulate, args=(g,)) for g in groups]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        else:
+            accumulate(np.arange(n_cells))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts[:, np.newaxis, np.newaxis], counts
+
+
+def block_sta(block, rec_no, window=3, chunk=4096, workers=1):
+    """
+    Computes the STAs of all cells of recording <rec_no> in a block written by convert_ret1.
+
+    :return:    Tuple (stas, counts, names) with the names of the spike arrays
+    """
+    stimulus = block.data_arrays['stimulus_%d_data' % rec_no]
+    pattern = re.compile(r'^RGC_(\d+)_stim_%d$' % rec_no)
+
+    arrays = [da for da in block.data_arrays if pattern.match(da.name)]
+    arrays.sort(key=lambda da: int(pattern.match(da.name).group(1)))
+
+    stas, counts = sta(stimulus, arrays, window=window, chunk=chunk, workers=workers)
+    return stas, counts, [da.name for da in arrays]
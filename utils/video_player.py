@@ -3,96 +3,426 @@
 from __future__ import print_function, division
 
 import nixio as nix
-import math
-import cv2
+import threading
+import time
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-import matplotlib
-matplotlib.use('TkAgg')
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    from .memmap import data_view
+except (ImportError, ValueError):
+    from memmap import data_view
+
+
+def writable(frames):
+    """
+    Returns <frames> as a writable, C-contiguous array. Frames from a read-only memory map
+    are copied, so that overlays can be drawn into them.
+    """
+    if frames.flags.writeable and frames.flags.c_contiguous:
+        return frames
+    return np.array(frames, order='C')
+
+
+def frame_axis(video_array):
+    """
+    Returns the axis along which the frames of a video array are stored: 0 for frame-major arrays
+    (frames, height, width, channels) whose first dimension is a range dimension, -1 otherwise
+    (height, width, channels, frames).
+    """
+    if video_array.dimensions[0].dimension_type == nix.DimensionType.Range:
+        return 0
+    return -1
+
+
+class FramePrefetcher(object):
+    """
+    Reads blocks of consecutive frames ahead of the playhead in a background thread and keeps
+    them in a fixed size ring buffer.
+    """
+
+    def __init__(self, video_array, block=32, capacity=8):
+        """
+        :param video_array: The video data array, frame-major or with frames in the last dimension
+        :param block:       Number of frames read at once
+        :param capacity:    Number of blocks kept in the buffer (including the current block)
+        """
+        self.data = data_view(video_array)
+        self.axis = frame_axis(video_array)
+        shape = video_array.shape
+        self.nframes = shape[self.axis]
+        frame_shape = shape[1:] if self.axis == 0 else shape[:-1]
+
+        self.block = block
+        self.capacity = max(2, capacity)
+        self.__buffer = np.empty((self.capacity, block) + tuple(frame_shape), dtype=video_array.dtype)
+        self.__slots = [None] * self.capacity  # block number stored in each slot
+        self.__playhead = 0
+        self.__closed = False
+        self.__cond = threading.Condition()
+
+        self.__thread = threading.Thread(target=self.__run, name="frame-prefetch")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def get(self, i):
+        """
+        Returns a copy of frame <i>, waiting for it if it has not been read yet.
+        """
+        if not 0 <= i < self.nframes:
+            raise IndexError("Frame %d out of range" % i)
+
+        b = i // self.block
+        with self.__cond:
+            self.__playhead = i
+            self.__cond.notify_all()
+            while b not in self.__slots:
+                if self.__closed:
+                    raise RuntimeError("Prefetcher is closed")
+                self.__cond.wait()
+            return self.__buffer[self.__slots.index(b), i - b * self.block].copy()
+
+    def close(self):
+        with self.__cond:
+            self.__closed = True
+            self.__cond.notify_all()
+        self.__thread.join()
+
+    def __next_block(self):
+        first = self.__playhead // self.block
+        n_blocks = (self.nframes + self.block - 1) // self.block
+        wanted = range(first, min(first + self.capacity, n_blocks))
+
+        for b in wanted:
+            if b in self.__slots:
+                continue
+            free = [s for s, sb in enumerate(self.__slots) if sb is None or sb not in wanted]
+            return b, free[0]
+
+        return None
+
+    def __read(self, b, slot):
+        start = b * self.block
+        stop = min(self.nframes, start + self.block)
+        if self.axis == 0:
+            self.__buffer[slot, :stop - start] = self.data[start:stop]
+        else:
+            self.__buffer[slot, :stop - start] = np.moveaxis(self.data[..., start:stop], -1, 0)
+
+    def __run(self):
+        while True:
+            with self.__cond:
+                task = self.__next_block()
+                while not self.__closed and task is None:
+                    self.__cond.wait()
+                    task = self.__next_block()
+                if self.__closed:
+                    return
+                b, slot = task
+                self.__slots[slot] = None
+
+            self.__read(b, slot)
+
+            with self.__cond:
+                self.__slots[slot] = b
+                self.__cond.notify_all()
+
+
+def disk_offsets(radius):
+    """
+    Row and column offsets of all pixels of a filled circle around the origin.
+    """
+    y, x = np.ogrid[-radius: radius, -radius: radius]
+    dy, dx = np.nonzero(x**2 + y**2 <= radius**2)
+    return dy - radius, dx - radius
+
+
+class TrackIndex(object):
+    """
+    Maps each frame to the rows of the tracked positions that belong to it (one row per tracked
+    object). Built once, afterwards the rows of any frame are a slice lookup.
+    """
+
+    def __init__(self, ticks, times, nframes=None):
+        """
+        :param ticks:   Sorted time of each frame
+        :param times:   Time of each tracked position, in the unit of <ticks>
+        :param nframes: Number of frames (default len(ticks))
+        """
+        ticks = np.asarray(ticks, dtype=np.float64)
+        times = np.asarray(times, dtype=np.float64)
+        nframes = nframes or len(ticks)
+
+        # nearest tick for every position
+        right = np.clip(np.searchsorted(ticks, times), 1, len(ticks) - 1)
+        left = right - 1
+        self.frames = np.where(times - ticks[left] <= ticks[right] - times, left, right)
+        if len(ticks) == 1:
+            self.frames = np.zeros(len(times), dtype=np.intp)
+
+        self.order = np.argsort(self.frames, kind='mergesort')
+        self.offsets = np.searchsorted(self.frames[self.order], np.arange(nframes + 1))
+
+    def rows(self, i):
+        """
+        Returns the position rows tracked in frame <i>.
+        """
+        return self.order[self.offsets[i]:self.offsets[i + 1]]
+
+
+class TrackOverlay(object):
+    """
+    Draws the positions (and optionally the orientations) of a tracking MultiTag into frames.
+    """
+
+    def __init__(self, tracking_tag, ticks, nframes, show_orientation=False, radius=8):
+        """
+        :param tracking_tag:        MultiTag with positions (x, y, channel, time [s]) and the
+                                    orientations as first feature
+        :param ticks:               Time of each frame [ms]
+        :param nframes:             Number of frames
+        :param show_orientation:    Draw the orientation as a line through each position
+        :param radius:              Radius of the position marker in pixels
+        """
+        positions = np.asarray(tracking_tag.positions[:])
+        self.orientations = np.asarray(tracking_tag.features[0].data[:])
+        self.tracks = TrackIndex(ticks, positions[:,3] * 1000, nframes)
+        self.x = np.round(positions[:,0]).astype(int)
+        self.y = np.round(positions[:,1]).astype(int)
+        self.draw_orientation = show_orientation
+        self.disk = disk_offsets(radius)
+
+    def draw(self, frame, i):
+        """
+        Draws the objects tracked in frame <i> into <frame> (in place).
+        """
+        rows = self.tracks.rows(i)
+        if len(rows) > 0:
+            frame = self.draw_circ(frame, self.x[rows], self.y[rows])
+            if self.draw_orientation: 
+                frame = self.draw_line(frame, self.x[rows], self.y[rows], self.orientations[rows])
+        return frame
+
+    def draw_circ(self, frame, x_pos, y_pos):
+        dy, dx = self.disk
+        ys = (y_pos[:, np.newaxis] + dy).ravel()
+        xs = (x_pos[:, np.newaxis] + dx).ravel()
+        inside = (ys >= 0) & (ys < frame.shape[0]) & (xs >= 0) & (xs < frame.shape[1])
+        frame[ys[inside], xs[inside], :3] = (255, 0, 0)
+        return frame
+     
+    def draw_line(self, frame, x, y, phi):
+        import cv2
+
+        length = 20
+        dx = np.sin(phi/360.*2*np.pi) * length
+        dy = np.cos(phi/360.*2*np.pi) * length
+        for x0, y0, x1, y1 in zip(x-dx, y+dy, x+dx, y-dy):
+            cv2.line(frame, (int(x0), int(y0)), (int(x1), int(y1)), (250,255,0), 2)
+        return frame
+
+
+def export_video(video_array, filename, tracking_tag=None, show_orientation=False, fps=None, codec='MJPG',
+                 block=32, workers=4, depth=None):
+    """
+    Writes a video data array, optionally with the tracking overlay, to a video file without a display.
+
+    Decoding, overlay and encoding run as a pipeline: a reader thread reads blocks of frames from the
+    file, <workers> threads draw the overlay and convert the frames, and the calling thread encodes
+    them in order. At most <depth> blocks are in flight, which bounds the memory use.
+
+    :param video_array:         The video data array (frames in the first or the last dimension)
+    :param filename:            The output file
+    :param tracking_tag:        Optional MultiTag with the tracking positions
+    :param show_orientation:    Draw the orientations of the tracked objects
+    :param fps:                 Frames per second (default derived from the frame ticks)
+    :param codec:               FourCC code of the encoder
+    :param block:               Number of frames read at once
+    :param workers:             Number of overlay threads
+    :param depth:               Maximal number of blocks in flight (default 2 * workers)
+    :return:                    Number of frames written
+    """
+    axis = frame_axis(video_array)
+    source = data_view(video_array)
+    shape = video_array.shape
+    nframes = shape[axis]
+    height, width, channels = shape[1:] if axis == 0 else shape[:-1]
+    ticks = video_array.dimensions[axis].ticks
+    fps = fps or 1000.0 / np.mean(np.diff(ticks))
+
+    overlay = None
+    if tracking_tag is not None:
+        overlay = TrackOverlay(tracking_tag, ticks, nframes, show_orientation)
+
+    import cv2
+
+    writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*codec), fps, (width, height), channels > 1)
+    if not writer.isOpened():
+        raise IOError("Cannot open video writer for %s" % filename)
+
+    depth = depth or 2 * workers
+    in_flight = threading.BoundedSemaphore(depth)
+    decoded = queue.Queue()
+    encoded = queue.Queue()
+    failed = []
+
+    def read():
+        try:
+            for k, start in enumerate(range(0, nframes, block)):
+                in_flight.acquire()
+                if failed:
+                    break
+                stop = min(nframes, start + block)
+                if axis == 0:
+                    frames = source[start:stop]
+                else:
+                    frames = np.moveaxis(source[..., start:stop], -1, 0)
+                decoded.put((k, start, writable(frames)))
+        except Exception as e:
+            failed.append(e)
+        finally:
+            for _ in range(workers):
+                decoded.put(None)
+
+    def process():
+        while True:
+            item = decoded.get()
+            if item is None:
+                encoded.put(None)
+                return
+            k, start, frames = item
+            try:
+                if overlay is not None:
+                    for j in range(len(frames)):
+                        overlay.draw(frames[j], start + j)
+                if channels > 1:
+                    frames = np.ascontiguousarray(frames[..., 2::-1])  # RGB to BGR
+                else:
+                    frames = frames[..., 0]
+                encoded.put((k, frames))
+            except Exception as e:
+                failed.append(e)
+                encoded.put((k, None))
+
+    threads = [threading.Thread(target=read)] + [threading.Thread(target=process) for _ in range(workers)]
+    for t in threads:
+        t.daemon = True
+        t.start()
+
+    written, next_block, finished, pending = 0, 0, 0, {}
+    try:
+        while finished < workers:
+            item = encoded.get()
+            if item is None:
+                finished += 1
+                continue
+            pending[item[0]] = item[1]
+            while next_block in pending:
+                frames = pending.pop(next_block)
+                next_block += 1
+                in_flight.release()
+                if frames is None or failed:
+                    continue
+                for frame in frames:
+                    writer.write(frame)
+                written += len(frames)
+    finally:
+        writer.release()
+
+    if failed:
+        raise failed[0]
+    return written
+
 
 class Playback(object):
     
-    def __init__(self, fig, video_array, tracking_tag=None, show_orientation=False):
+    def __init__(self, fig, video_array, tracking_tag=None, show_orientation=False, prefetch=True,
+                 block=32, capacity=8):
         self.figure = fig
         self.axis = fig.add_subplot(111)
         self.im = None
 
-        self.data = video_array
-        self.height, self.width, self.channels, self.nframes = self.data.shape
-        dim = video_array.dimensions[-1]
+        self.data = data_view(video_array)
+        self.frame_axis = frame_axis(video_array)
+        if self.frame_axis == 0:
+            self.nframes, self.height, self.width, self.channels = self.data.shape
+        else:
+            self.height, self.width, self.channels, self.nframes = self.data.shape
+        dim = video_array.dimensions[self.frame_axis]
         ticks = dim.ticks
         self.interval = np.mean(np.diff(ticks))
+        self.frames = FramePrefetcher(video_array, block, capacity) if prefetch else None
         
         self.tag = tracking_tag
+        self.overlay = None
         if self.tag is not None:
-            self.positions = self.tag.positions
-            self.orientations = self.tag.features[0].data
-            self.tracked_indices = self.__track_indices(ticks, self.positions[:,3])
-            self.x = self.positions[:,0]
-            self.y = self.positions[:,1]
-            self.track_counter = 0
-            self.draw_orientation = show_orientation
-    
-    def __track_indices(self, ticks, times):
-        indices = np.zeros_like(times)
-        for i,t in enumerate(times):
-            indices[i] = np.argmin(np.abs(np.asarray(ticks) - t*1000))   
-        return indices
-
-    def __draw_circ(self, frame, x_pos, y_pos):
-        radius = 8
-        y, x = np.ogrid[-radius: radius, -radius: radius]
-        index = x**2 + y**2 <= radius**2
-        frame[y_pos-radius:y_pos+radius, x_pos-radius:x_pos+radius, 0][index] = 255
-        frame[y_pos-radius:y_pos+radius, x_pos-radius:x_pos+radius, 1][index] = 0
-        frame[y_pos-radius:y_pos+radius, x_pos-radius:x_pos+radius, 2][index] = 0
-        return frame
-     
-    def __draw_line(self, frame, x, y, phi):
-        length = 20
-        dx = math.sin(phi/360.*2*np.pi) * length
-        dy = math.cos(phi/360.*2*np.pi) * length
-        cv2.line(frame, (int(x-dx),int(y+dy)),
-                 (int(x+dx), int(y-dy)), (250,255,0), 2)
-        return frame
+            self.overlay = TrackOverlay(self.tag, ticks, self.nframes, show_orientation)
+
+    def read_frame(self, i):
+        if self.frames is not None:
+            return self.frames.get(i)
+        if self.frame_axis == 0:
+            return writable(self.data[i])
+        return writable(self.data[:,:,:,i])
 
     def grab_frame(self, i):
-        frame = self.data[:,:,:,i]
-        if self.tag is not None:
-            if i in self.tracked_indices:
-                frame = self.__draw_circ(frame, self.x[self.track_counter], 
-                                         self.y[self.track_counter]) 
-                if self.draw_orientation: 
-                    frame = self.__draw_line(frame,self.x[self.track_counter], 
-                                             self.y[self.track_counter],
-                                             self.orientations[self.track_counter])
-                self.track_counter += 1
-        if self.im == None:
-            im = self.axis.imshow(frame)
+        frame = self.read_frame(i)
+        if self.overlay is not None:
+            frame = self.overlay.draw(frame, i)
+        if self.im is None:
+            self.im = self.axis.imshow(frame)
         else:
-            im.set_data(frame)
-        return im, 
+            self.im.set_data(frame)
+        return self.im, 
 
     def start(self):
+        import matplotlib.pyplot as plt
+        import matplotlib.animation as animation
+
         ani = animation.FuncAnimation(self.figure, self.grab_frame,
                                       range(1,self.nframes,1), interval=self.interval, 
                                       repeat=False, blit=True)
         plt.show()
+        self.close()
+
+    def close(self):
+        if self.frames is not None:
+            self.frames.close()
+            self.frames = None
 
 
 if __name__ == '__main__':
-    import nix
-    import numpy as np
-    import matplotlib
-    import matplotlib.pyplot as plt
-        
-    nix_file = nix.File.open('../data/tracking_data.h5', nix.FileMode.ReadOnly)
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Play or export a NIX video array')
+    parser.add_argument('file', nargs='?', default='../data/tracking_data.h5')
+    parser.add_argument('--video', default='video', help='Name of the video data array')
+    parser.add_argument('--tag', default='tracking', help='Name of the tracking multi tag (empty for none)')
+    parser.add_argument('--orientation', action='store_true', help='Draw the orientations')
+    parser.add_argument('--export', default=None, help='Write to this video file instead of playing')
+    parser.add_argument('--fps', type=float, default=None)
+    parser.add_argument('--codec', default='MJPG')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    nix_file = nix.File.open(args.file, nix.FileMode.ReadOnly)
     b = nix_file.blocks[0]
-    video = [a for a in b.data_arrays if a.name == "video"][0]
-    tag = [t for t in b.multi_tags if t.name == "tracking"][0]
-    
-    fig = plt.figure(facecolor='white')
-    pb = Playback(fig, video, tracking_tag=tag, show_orientation=True)
-    pb.start()
+    video = b.data_arrays[args.video]
+    tag = b.multi_tags[args.tag] if args.tag else None
+
+    if args.export:
+        started = time.time()
+        n = export_video(video, args.export, tracking_tag=tag, show_orientation=args.orientation,
+                         fps=args.fps, codec=args.codec, workers=args.workers)
+        print('%d frames written to %s in %.1fs' % (n, args.export, time.time() - started))
+    else:
+        import matplotlib.pyplot as plt
+        plt.switch_backend('TkAgg')
+        fig = plt.figure(facecolor='white')
+        pb = Playback(fig, video, tracking_tag=tag, show_orientation=args.orientation)
+        pb.start()
     nix_file.close()